@@ -1,9 +1,14 @@
-import pandas as pd
+import os
+import sys
+
+sys.path.append(os.getcwd())
+
+from environment.storage import read_dataset
 
 # Read data
-df_base = pd.read_csv("Data/processed/features/df_features_raw_ref500.csv")
-df_500 = pd.read_csv("Data/processed/features/df_features_raw_ref500.csv")
-df_3000 = pd.read_csv("Data/processed/features/df_features_raw_ref3000.csv")
+df_base = read_dataset('features', pool=500)
+df_500 = read_dataset('features', pool=500)
+df_3000 = read_dataset('features', pool=3000)
 
 
 df_30horizons = df_base[df_base['horizon_label'] <= 30]
@@ -1,10 +1,17 @@
 import os
-import pickle
+import sys
 import pytz
 import pandas as pd
 import matplotlib.pyplot as plt
 from matplotlib.lines import Line2D
 
+sys.path.append(os.getcwd())
+sys.path.append(os.path.join(os.getcwd(), 'Code', 'feature_engineering'))
+
+from environment.storage import read_dataset
+from utils.event_store import EventStore
+from utils.interval_index import IntervalOffsets
+
 key_dates = {
     'terra_luna': '2022-05-12',
     'the_merge': '2022-09-06',
@@ -16,10 +23,9 @@ colors = {
 }
 
 CLEANSED_FILEPATH = "Data/cleansed"
-RESULTS_DIR = "Data/interim_results"
 
-df_blocks = pd.read_csv(os.path.join(RESULTS_DIR, "df_blocks.csv"))
-df_blocks_full = pd.read_csv(os.path.join(RESULTS_DIR, "df_blocks_full.csv"))
+df_blocks = read_dataset('df_blocks')
+df_blocks_full = read_dataset('df_blocks_full')
 
 
 
@@ -62,8 +68,7 @@ def get_interval_metrics(data):
 
     return pool_ranges
 
-with open(os.path.join(RESULTS_DIR, "interval_dataframes.pickle"), "rb") as pickle_file:
-    data = pickle.load(pickle_file)
+data = IntervalOffsets.load(EventStore.open(), read_dataset('interval_offsets'))
 
 metrics = get_interval_metrics(data)
 print(metrics)
@@ -75,8 +80,7 @@ def analyse_transaction_counts():
     Analyse the number of transactions per day for each pool and transaction type.
     Note - this uses the df_reduced which excludes >1 mint operations if they belong to the same block.
     """
-    results_dir = RESULTS_DIR
-    df_reduced = pd.read_csv(os.path.join(results_dir, "df_reduced.csv"))
+    df_reduced = read_dataset('df_reduced')
 
     df_reduced['timestamp'] = pd.to_datetime(df_reduced['timestamp'])
     df_reduced['date'] = df_reduced['timestamp'].dt.date
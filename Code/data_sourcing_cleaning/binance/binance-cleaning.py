@@ -1,6 +1,24 @@
+# Make sure to set cwd to project path to run this script
+import sys
 import os
+sys.path.append(os.getcwd())
+
+import glob
+import numpy as np
 import pandas as pd
+from functools import partial
 from tqdm import tqdm
+from concurrent.futures import ProcessPoolExecutor
+from partition_manifest import load_manifest, save_manifest, INGEST_MANIFEST, CLEANING_MANIFEST
+from environment.time_spans import load_run_config, time_spans, generate_date_scope
+from environment.storage import STORAGE_FORMAT, dataset_exists, write_dataset
+
+selected_span = load_run_config('environment/run-config.env')
+scope_date = generate_date_scope(time_spans[selected_span]["start"], time_spans[selected_span]["end"])
+
+# Input format: 'columnar' (daily Parquet partitions in Data/binance) or 'csv' (Data/binance.csv)
+BINANCE_OUTPUT = os.getenv("BINANCE_OUTPUT", "csv").strip()
+partition_path = 'Data/binance'
 
 # Directory path
 out_directory = 'Data/cleansed'
@@ -9,7 +27,7 @@ out_directory = 'Data/cleansed'
 if not os.path.exists(out_directory):
     os.makedirs(out_directory)
 
-def uniform_distribution(df, time_column, agg_dict, rename_dict=None, interval='S'):
+def uniform_distribution(df, time_column, agg_dict, rename_dict=None, interval='S', carry=None):
     """
     Perform uniform distribution of values over time intervals in a DataFrame.
 
@@ -19,18 +37,123 @@ def uniform_distribution(df, time_column, agg_dict, rename_dict=None, interval='
     To bridge this discrepancy, we uniformly spread the volume and trade counts over each second of the minute.
     This will create a second-by-second approximation of the trade data that would align better with the DEX dataset when they are combined.
 
+    # Incremental resampling:
+    `carry` is the last resampled row of the previous increment (a Series named by its time, with the agg_dict columns).
+    The increment then starts on the interval right after it, so the seconds between the two increments are not lost,
+    summed and counted columns are 0 there and the other columns are forward filled from the carried row.
+    Appending the increment gives the same rows as resampling the whole span at once.
+
     """
     print("Resampling and aggregating data...")
-    df_resampled = df.set_index(time_column).resample(interval).agg(agg_dict).ffill().reset_index()
+    df_resampled = df.set_index(time_column).resample(interval).agg(agg_dict)
+    if carry is not None:
+        dtypes = df_resampled.dtypes
+        start = carry.name + pd.tseries.frequencies.to_offset(interval)
+        df_resampled = df_resampled.reindex(pd.date_range(start, df_resampled.index[-1], freq=interval, name=time_column))
+        totals = [column for column, agg in agg_dict.items() if agg in ('sum', 'count')]
+        df_resampled[totals] = df_resampled[totals].fillna(0)
+        df_resampled = df_resampled.ffill().fillna(carry[list(agg_dict)]).astype(dtypes)
+    else:
+        df_resampled = df_resampled.ffill()
+    df_resampled = df_resampled.reset_index()
     if rename_dict:
         print("Renaming columns...")
         df_resampled.rename(columns=rename_dict, inplace=True)
 
     return df_resampled
 
-def main(sample=False):
+def format_utc_seconds(series):
+    """Format UTC timestamps on whole seconds as DataFrame.to_csv does ('YYYY-MM-DD HH:MM:SS+00:00'), vectorized."""
+    text = np.datetime_as_string(series.dt.tz_localize(None).values, unit='s')
+    return np.char.add(np.char.replace(text, 'T', ' '), '+00:00')
+
+def encode_csv(df, time_column=None):
+    """Encode a row group as CSV text, without header or index."""
+    if time_column:
+        df = df.assign(**{time_column: format_utc_seconds(df[time_column])})
+    return df.to_csv(index=False, header=False)
+
+def write_csv_bulk(df, path, append=False, time_column=None, row_group_size=1000000, max_workers=os.cpu_count()):
+    """
+    Write a DataFrame to CSV in large row groups, encoding several row groups in parallel.
+
+    Row groups are encoded by a pool of max_workers processes and written in order through one open file, with
+    progress reported per row group. The text is the same as a single DataFrame.to_csv(index=False).
+
+    Args:
+        df (pd.DataFrame): Data to write.
+        path (str): Output CSV file.
+        append (bool): Append to an existing file instead of overwriting it, without repeating the header.
+        time_column (str): Optional UTC timestamp column on whole seconds, formatted with numpy instead of per value.
+        row_group_size (int): Number of rows encoded at once.
+        max_workers (int): Number of encoding processes, 1 to encode in this process.
+    """
+    encode = partial(encode_csv, time_column=time_column)
+    row_groups = [df.iloc[start:start + row_group_size] for start in range(0, len(df), row_group_size)]
+    with open(path, 'a' if append else 'w', newline='') as file, \
+            tqdm(total=len(df), unit='rows', desc='Writing row groups') as pbar:
+        if not append:
+            file.write(df.head(0).to_csv(index=False))
+        if max_workers and max_workers > 1:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                for row_group, text in zip(row_groups, executor.map(encode, row_groups)):
+                    file.write(text)
+                    pbar.update(len(row_group))
+        else:
+            for row_group in row_groups:
+                file.write(encode(row_group))
+                pbar.update(len(row_group))
+
+def read_partitions(partition_path, dates, columns=None):
+    """Read the daily Parquet partitions of the given dates, skipping days without trades."""
+    paths = [path for date in dates for path in sorted(glob.glob(os.path.join(partition_path, f'date={date}', '*.parquet')))]
+    if not paths:
+        return pd.DataFrame(columns=columns)
+    return pd.concat([pd.read_parquet(path, columns=columns) for path in paths], ignore_index=True)
+
+def pending_dates(scope_date, ingested_dates, watermark):
+    """Scope days after the watermark, up to the first day that is not ingested yet, so the cleansed output has no gaps."""
+    dates = []
+    for date in scope_date:
+        if watermark and date <= watermark:
+            continue
+        if date not in ingested_dates:
+            break
+        dates.append(date)
+    return dates
+
+def main(sample=False, full_refresh=False):
+    # With daily partitions, only the days after the cleaning watermark are read and appended
+    incremental = BINANCE_OUTPUT == 'columnar' and not sample
+    manifest = load_manifest(CLEANING_MANIFEST) if incremental and not full_refresh else {}
+    if manifest.get('span') != selected_span or not dataset_exists('binance'):
+        manifest = {}
+    carry = None
+
     # Read binance data
-    if sample:
+    if BINANCE_OUTPUT == 'columnar':
+        print("Reading the daily partitions...")
+        if sample:
+            df = read_partitions(partition_path, scope_date[:1], columns=['id', 'price', 'quoteQty', 'time']).head(100)
+        else:
+            dates = pending_dates(scope_date, set(load_manifest(INGEST_MANIFEST).get('dates', [])), manifest.get('watermark'))
+            if not dates:
+                print("No new partitions since", manifest.get('watermark'))
+                return
+            print(f"Cleaning {dates[0]} to {dates[-1]}")
+            df = read_partitions(partition_path, dates, columns=['id', 'price', 'quoteQty', 'time'])
+            if df.empty:
+                print("No trades in the new partitions")
+                if manifest.get('carry'):
+                    # Days without trades only move the watermark, the next trades are still filled from the same row
+                    save_manifest(CLEANING_MANIFEST, {**manifest, 'span': selected_span, 'watermark': dates[-1]})
+                elif os.path.exists(CLEANING_MANIFEST):
+                    # Nothing written yet (first run or full refresh): the next run starts over and overwrites the dataset
+                    os.remove(CLEANING_MANIFEST)
+                return
+            if manifest.get('carry'):
+                carry = pd.Series(manifest['carry']['values'], name=pd.Timestamp(manifest['carry']['time']))
+    elif sample:
         print("Reading a sample of the data...")
         df = pd.read_csv("Data/binance.csv", nrows=100)
     else:
@@ -59,19 +182,25 @@ def main(sample=False):
     }
 
     # Note -> By having the mid-price at each second, we can better track price movements and identify potential arbitrage opportunities which can trigger volume spikes.
-    df_uniform = uniform_distribution(df, 'time', agg_dict, rename_dict=rename_dict)
-
-    chunk_size = 1000  # Set the desired chunk size
+    if carry is not None:
+        carry = carry.rename({renamed: column for column, renamed in rename_dict.items()})
+    df_uniform = uniform_distribution(df, 'time', agg_dict, rename_dict=rename_dict, carry=carry)
 
     print("Saving the uniform data...")
-    with tqdm(total=len(df_uniform)) as pbar:
-        for i, chunk in enumerate(df_uniform.groupby(df_uniform.index // chunk_size)):
-            chunk_df = chunk[1]
-            if i == 0:
-                chunk_df.to_csv(f'{out_directory}/binance.csv', index=False)
-            else:
-                chunk_df.to_csv(f'{out_directory}/binance.csv', index=False, header=False, mode='a')
-            pbar.update(len(chunk_df))
+    if STORAGE_FORMAT == 'csv':
+        write_csv_bulk(df_uniform, f'{out_directory}/binance.csv', append=carry is not None, time_column='time')
+    else:
+        write_dataset(df_uniform, 'binance', append=carry is not None)
+
+    if incremental:
+        # Move the watermark and keep the last row to seed the next increment
+        last = df_uniform.iloc[-1:].to_dict('records')[0]
+        save_manifest(CLEANING_MANIFEST, {
+            'span': selected_span,
+            'watermark': dates[-1],
+            'rows': manifest.get('rows', 0) + len(df_uniform),
+            'carry': {'time': last.pop('time').isoformat(), 'values': last}
+        })
     print("binance data cleansing and aggregation completed.")
 
 
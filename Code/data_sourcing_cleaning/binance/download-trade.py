@@ -12,14 +12,27 @@
   python Code/DataSourcingCleaning/binance/download-trade.py -t "spot" -s "ETHBTC" -skip-monthly 1
   ```
 
+  With `-plan 1` the archives are planned from the run config span (see plan_archives): monthly archives for the
+  months the span fully covers, daily archives only for the partial months at its edges:
+  ```bash
+  python Code/data_sourcing_cleaning/binance/download-trade.py -t "spot" -s "ETHBTC" -plan 1
+  ```
+
+  Archives are downloaded concurrently (MAX_DOWNLOADS at a time) over a pooled session, partial downloads are
+  resumed, and every archive is verified against its published SHA-256 CHECKSUM file (the one downloaded with it
+  when checksums are requested). Archives without a published checksum are reported as unverified.
+
 """
 
 from datetime import *
 import pandas as pd
 from enums import *
-from utility import download_file, get_all_symbols, get_parser, get_start_end_date_objects, convert_to_date_object, \
+from utility import download_files, get_all_symbols, get_parser, get_start_end_date_objects, convert_to_date_object, \
   get_path
 
+# Number of concurrent downloads (and pooled connections)
+MAX_DOWNLOADS = 8
+
 
 def download_monthly_trades(trading_type, symbols, num_symbols, years, months, start_date, end_date, folder, checksum):
   current = 0
@@ -40,6 +53,7 @@ def download_monthly_trades(trading_type, symbols, num_symbols, years, months, s
 
   print("Found {} symbols".format(num_symbols))
 
+  jobs = []
   for symbol in symbols:
     print("[{}/{}] - start download monthly {} trades ".format(current+1, num_symbols, symbol))
     for year in years:
@@ -48,15 +62,74 @@ def download_monthly_trades(trading_type, symbols, num_symbols, years, months, s
         if current_date >= start_date and current_date <= end_date:
           path = get_path(trading_type, "trades", "monthly", symbol)
           file_name = "{}-trades-{}-{}.zip".format(symbol.upper(), year, '{:02d}'.format(month))
-          download_file(path, file_name, date_range, folder)
+          jobs.append((path, file_name, date_range, folder))
 
           if checksum == 1:
             checksum_path = get_path(trading_type, "trades", "monthly", symbol)
             checksum_file_name = "{}-trades-{}-{}.zip.CHECKSUM".format(symbol.upper(), year, '{:02d}'.format(month))
-            download_file(checksum_path, checksum_file_name, date_range, folder)
+            jobs.append((checksum_path, checksum_file_name, date_range, folder))
     
     current += 1
 
+  return download_files(jobs, max_workers=MAX_DOWNLOADS)
+
+def plan_archives(start_date, end_date):
+  """
+  Splits the days from start_date to end_date (inclusive) into monthly and daily archives.
+
+  Months fully covered by the span are fetched as one monthly archive, the partial months at the edges day by day.
+
+  Returns:
+    Tuple[list, list]: (year, month) tuples for monthly archives, and 'YYYY-MM-DD' dates for daily archives.
+  """
+  months, dates = [], []
+  month_start = date(start_date.year, start_date.month, 1)
+  while month_start <= end_date:
+    next_month = date(month_start.year + month_start.month // 12, month_start.month % 12 + 1, 1)
+    month_end = next_month - timedelta(days=1)
+    if start_date <= month_start and month_end <= end_date:
+      months.append((month_start.year, month_start.month))
+    else:
+      first, last = max(month_start, start_date), min(month_end, end_date)
+      dates.extend((first + timedelta(days=i)).strftime('%Y-%m-%d') for i in range((last - first).days + 1))
+    month_start = next_month
+  return months, dates
+
+def download_planned_trades(trading_type, symbols, start_date, end_date, folder, checksum):
+  """
+  Downloads the archives chosen by plan_archives. A month whose monthly archive is not published yet falls back
+  to its daily archives.
+  """
+  months, dates = plan_archives(start_date, end_date)
+  print("Planned {} monthly and {} daily archives per symbol".format(len(months), len(dates)))
+
+  jobs = []
+  for symbol in symbols:
+    for year, month in months:
+      path = get_path(trading_type, "trades", "monthly", symbol)
+      file_name = "{}-trades-{}-{:02d}.zip".format(symbol.upper(), year, month)
+      jobs.append((path, file_name, None, folder))
+      if checksum == 1:
+        jobs.append((path, file_name + ".CHECKSUM", None, folder))
+  results = download_files(jobs, max_workers=MAX_DOWNLOADS)
+
+  for year, month in months:
+    if any(results.get("{}-trades-{}-{:02d}.zip".format(symbol.upper(), year, month)) == 'missing' for symbol in symbols):
+      month_start = date(year, month, 1)
+      month_days = (date(year + month // 12, month % 12 + 1, 1) - month_start).days
+      dates.extend((month_start + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(month_days))
+
+  jobs = []
+  for symbol in symbols:
+    for day in sorted(dates):
+      path = get_path(trading_type, "trades", "daily", symbol)
+      file_name = "{}-trades-{}.zip".format(symbol.upper(), day)
+      jobs.append((path, file_name, None, folder))
+      if checksum == 1:
+        jobs.append((path, file_name + ".CHECKSUM", None, folder))
+  results.update(download_files(jobs, max_workers=MAX_DOWNLOADS))
+  return results
+
 def download_daily_trades(trading_type, symbols, num_symbols, dates, start_date, end_date, folder, checksum):
   current = 0
   date_range = None
@@ -76,6 +149,7 @@ def download_daily_trades(trading_type, symbols, num_symbols, dates, start_date,
     
   print("Found {} symbols".format(num_symbols))
 
+  jobs = []
   for symbol in symbols:
     print("[{}/{}] - start download daily {} trades ".format(current+1, num_symbols, symbol))
     for date in dates:
@@ -83,17 +157,22 @@ def download_daily_trades(trading_type, symbols, num_symbols, dates, start_date,
       if current_date >= start_date and current_date <= end_date:
         path = get_path(trading_type, "trades", "daily", symbol)
         file_name = "{}-trades-{}.zip".format(symbol.upper(), date)
-        download_file(path, file_name, date_range, folder)
+        jobs.append((path, file_name, date_range, folder))
 
         if checksum == 1:
           checksum_path = get_path(trading_type, "trades", "daily", symbol)
           checksum_file_name = "{}-trades-{}.zip.CHECKSUM".format(symbol.upper(), date)
-          download_file(checksum_path, checksum_file_name, date_range, folder)
+          jobs.append((checksum_path, checksum_file_name, date_range, folder))
 
     current += 1
 
+  return download_files(jobs, max_workers=MAX_DOWNLOADS)
+
 if __name__ == "__main__":
     parser = get_parser('trades')
+    parser.add_argument(
+        '-plan', dest='plan', default=0, type=int, choices=[0, 1],
+        help='1 to download monthly archives for fully covered months and daily archives for the rest of the run config span, default 0')
     args = parser.parse_args(sys.argv[1:])
 
     if not args.symbols:
@@ -105,15 +184,19 @@ if __name__ == "__main__":
       num_symbols = len(symbols)
       print("fetching {} symbols from exchange".format(num_symbols))
 
-    if args.dates:
-      dates = args.dates
+    if args.plan == 1:
+      start_date = convert_to_date_object(args.startDate) if args.startDate else START_DATE
+      end_date = convert_to_date_object(args.endDate) if args.endDate else END_DATE
+      download_planned_trades(args.type, symbols, start_date, end_date, args.folder, args.checksum)
     else:
-      period = convert_to_date_object(datetime.today().strftime('%Y-%m-%d')) - convert_to_date_object(
-        PERIOD_START_DATE)
-      dates = pd.date_range(end=datetime.today(), periods=period.days + 1).to_pydatetime().tolist()
-      dates = [date.strftime("%Y-%m-%d") for date in dates]
-      if args.skip_monthly == 0:
-        download_monthly_trades(args.type, symbols, num_symbols, args.years, args.months, args.startDate, args.endDate, args.folder, args.checksum)
-    if args.skip_daily == 0:
-      download_daily_trades(args.type, symbols, num_symbols, dates, args.startDate, args.endDate, args.folder, args.checksum)
-    
\ No newline at end of file
+      if args.dates:
+        dates = args.dates
+      else:
+        period = convert_to_date_object(datetime.today().strftime('%Y-%m-%d')) - convert_to_date_object(
+          PERIOD_START_DATE)
+        dates = pd.date_range(end=datetime.today(), periods=period.days + 1).to_pydatetime().tolist()
+        dates = [date.strftime("%Y-%m-%d") for date in dates]
+        if args.skip_monthly == 0:
+          download_monthly_trades(args.type, symbols, num_symbols, args.years, args.months, args.startDate, args.endDate, args.folder, args.checksum)
+      if args.skip_daily == 0:
+        download_daily_trades(args.type, symbols, num_symbols, dates, args.startDate, args.endDate, args.folder, args.checksum)
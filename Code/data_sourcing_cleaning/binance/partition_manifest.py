@@ -0,0 +1,47 @@
+"""
+Binance Partition Manifests
+
+Small JSON manifests that make the Binance ingestion and cleaning incremental:
+- The ingestion manifest (Data/binance/_manifest.json) lists the archives already written to the daily
+  partitions, with their trade counts, and the days they cover.
+- The cleaning manifest (Data/cleansed/binance_manifest.json) holds the high-water mark: the last day already
+  resampled into the cleansed binance dataset and the last resampled row, which seeds the forward fill of the next
+  increment.
+"""
+
+import os
+import json
+from datetime import date, timedelta
+
+INGEST_MANIFEST = 'Data/binance/_manifest.json'
+CLEANING_MANIFEST = 'Data/cleansed/binance_manifest.json'
+
+
+def load_manifest(path):
+    """Load a manifest, or return an empty one if it does not exist yet."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as file:
+        return json.load(file)
+
+
+def save_manifest(path, manifest):
+    """Write a manifest atomically, so an interrupted run never leaves it half written."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(tmp_path, path)
+
+
+def archive_dates(archive):
+    """
+    Days covered by an archive, from its name: 'ETHBTC-trades-YYYY-MM-DD' covers one day,
+    'ETHBTC-trades-YYYY-MM' the whole month.
+    """
+    parts = archive.split('-')
+    if len(parts[-3]) == 4:
+        return ['-'.join(parts[-3:])]
+    year, month = int(parts[-2]), int(parts[-1])
+    month_start = date(year, month, 1)
+    next_month = date(year + month // 12, month % 12 + 1, 1)
+    return [(month_start + timedelta(days=i)).strftime('%Y-%m-%d') for i in range((next_month - month_start).days)]
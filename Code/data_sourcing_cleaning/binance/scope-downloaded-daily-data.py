@@ -3,8 +3,14 @@ import sys
 import os
 sys.path.append(os.getcwd())
 
+import glob
 import zipfile
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from concurrent.futures import ThreadPoolExecutor
+from tqdm import tqdm
+from partition_manifest import load_manifest, save_manifest, archive_dates, INGEST_MANIFEST
 from environment.time_spans import load_run_config, time_spans, generate_date_scope
 
 # Select the desired time span for analysis
@@ -13,39 +19,132 @@ selected_span = load_run_config('environment/run-config.env')
 START = time_spans[selected_span]["start"]
 END = time_spans[selected_span]["end"]
 
+# Output format: 'columnar' (daily Parquet partitions in Data/binance) or 'csv' (Data/binance.csv)
+BINANCE_OUTPUT = os.getenv("BINANCE_OUTPUT", "csv").strip()
+partition_path = 'Data/binance'
+INGEST_WORKERS = 4
+INGEST_CHUNK_ROWS = 1000000  # Trades read at a time from a CSV member, a monthly member holds tens of millions
+
 # Generate scope date
 scope_date = generate_date_scope(START, END)
+scope_month = sorted(set(date[:7] for date in scope_date))
 
-# Define directory with zip files and destination for extraction
-zip_dir_path = 'Code/DataSourcingCleaning/binance/data/spot/daily/trades/ETHBTC'
+# Define directories with daily and monthly zip files and destination for extraction
+zip_dir_paths = {
+    'daily': 'Code/data_sourcing_cleaning/binance/data/spot/daily/trades/ETHBTC',
+    'monthly': 'Code/data_sourcing_cleaning/binance/data/spot/monthly/trades/ETHBTC'
+}
 extract_to_path = 'Data/binance-extracts'
 
-# Initialize a list to store DataFrames
-dfs = []
+# Binance trade archives have no header
+trade_columns = ['id', 'price', 'qty', 'quoteQty', 'time', 'isBuyerMaker', 'isBestMatch']
+trade_dtypes = {'id': 'int64', 'price': 'float64', 'qty': 'float64', 'quoteQty': 'float64', 'time': 'int64',
+                'isBuyerMaker': 'bool', 'isBestMatch': 'bool'}
+trade_schema = pa.schema([('id', pa.int64()), ('price', pa.float64()), ('qty', pa.float64()), ('quoteQty', pa.float64()),
+                          ('time', pa.int64()), ('isBuyerMaker', pa.bool_()), ('isBestMatch', pa.bool_())])
+
+def scoped_archives(zip_dir_paths, scope_date, scope_month):
+    """
+    List the downloaded archives in scope: monthly archives of scope months, and daily archives of scope dates
+    whose month is not already covered by a monthly archive.
+    """
+    archives = {}
+    for archive_type, zip_dir_path in zip_dir_paths.items():
+        if os.path.exists(zip_dir_path):
+            archives[archive_type] = [file_name for file_name in sorted(os.listdir(zip_dir_path)) if file_name.endswith('.zip')]
+        else:
+            archives[archive_type] = []
+
+    # ETHBTC-trades-YYYY-MM.zip
+    monthly = [file_name for file_name in archives['monthly'] if file_name[-11:-4] in scope_month]
+    covered_months = set(file_name[-11:-4] for file_name in monthly)
+    # ETHBTC-trades-YYYY-MM-DD.zip
+    daily = [file_name for file_name in archives['daily'] if file_name[-14:-4] in scope_date and file_name[-14:-7] not in covered_months]
+    return [os.path.join(zip_dir_paths['monthly'], file_name) for file_name in monthly] + \
+           [os.path.join(zip_dir_paths['daily'], file_name) for file_name in daily]
+
+def ingest_archive(file_path, partition_path, skip_dates=frozenset(), chunksize=INGEST_CHUNK_ROWS):
+    """
+    Read the CSV members of one archive straight from the zip, in chunks of chunksize trades with explicit dtypes,
+    and write them to one Parquet partition file per UTC day ('date=YYYY-MM-DD/trades.parquet').
+
+    A day's file is written under a temporary name and replaces any earlier file of that day when complete, so
+    a day ingested from two archives (e.g. a daily zip, then the monthly zip of its month) is only stored once.
+    Days in skip_dates, already ingested, are not written again.
+
+    Returns:
+        int: Number of trades written.
+    """
+    rows = 0
+    writers = {}
+    with zipfile.ZipFile(file_path, 'r') as zip_ref:
+        for member in zip_ref.namelist():
+            if not member.endswith('.csv'):
+                continue
+            with zip_ref.open(member) as csv_file:
+                for df in pd.read_csv(csv_file, names=trade_columns, dtype=trade_dtypes, chunksize=chunksize):
+                    days = pd.to_datetime(df['time'], unit='ms').dt.strftime('%Y-%m-%d')
+                    for day, day_df in df.groupby(days, sort=True):
+                        if day in skip_dates:
+                            continue
+                        if day not in writers:
+                            os.makedirs(os.path.join(partition_path, f'date={day}'), exist_ok=True)
+                            writers[day] = pq.ParquetWriter(os.path.join(partition_path, f'date={day}', 'trades.parquet.tmp'), trade_schema)
+                        writers[day].write_table(pa.Table.from_pandas(day_df, schema=trade_schema, preserve_index=False))
+                        rows += len(day_df)
+    for day, writer in writers.items():
+        writer.close()
+        day_path = os.path.join(partition_path, f'date={day}')
+        # Partition files of earlier layouts were named after their archive
+        for stale_path in glob.glob(os.path.join(day_path, '*.parquet')):
+            os.remove(stale_path)
+        os.replace(os.path.join(day_path, 'trades.parquet.tmp'), os.path.join(day_path, 'trades.parquet'))
+    return rows
 
-# Iterate over each file in directory
-for file_name in os.listdir(zip_dir_path):
-    # Check if file is a zip file and in scope_date
-    if file_name.endswith('.zip') and any(date in file_name for date in scope_date):
-        # Create full file path
-        file_path = os.path.join(zip_dir_path, file_name)
+if BINANCE_OUTPUT == 'columnar':
+    # Stream the archives in scope that are not in the manifest yet into daily Parquet partitions,
+    # several archives at a time, recording each one as soon as it is written. Days already ingested
+    # from another archive are skipped
+    os.makedirs(partition_path, exist_ok=True)
+    manifest = load_manifest(INGEST_MANIFEST)
+    manifest.setdefault('archives', {})
+    ingested_dates = frozenset(manifest.get('dates', []))
+    archives = [file_path for file_path in scoped_archives(zip_dir_paths, set(scope_date), set(scope_month))
+                if os.path.basename(file_path)[:-len('.zip')] not in manifest['archives']]
+    rows = 0
+    with ThreadPoolExecutor(max_workers=INGEST_WORKERS) as executor, tqdm(total=len(archives), desc='Ingesting new archives') as pbar:
+        for file_path, archive_rows in zip(archives, executor.map(lambda file_path: ingest_archive(file_path, partition_path, ingested_dates), archives)):
+            archive = os.path.basename(file_path)[:-len('.zip')]
+            manifest['archives'][archive] = archive_rows
+            manifest['dates'] = sorted(set(manifest.get('dates', [])) | set(archive_dates(archive)))
+            save_manifest(INGEST_MANIFEST, manifest)
+            rows += archive_rows
+            pbar.update(1)
+    print(f"{rows} trades written to {partition_path}")
+else:
+    # Initialize a list to store DataFrames
+    dfs = []
+    extracted = []
 
+    # Iterate over each archive in scope
+    for file_path in scoped_archives(zip_dir_paths, set(scope_date), set(scope_month)):
         # Open zip file
         with zipfile.ZipFile(file_path, 'r') as zip_ref:
             # Extract all files to specified path
             zip_ref.extractall(extract_to_path)
+            extracted.extend(zip_ref.namelist())
 
-# Find csv files in the extracted files
-for file in os.listdir(extract_to_path):
-    if file.endswith(".csv"):
-        csv_path = os.path.join(extract_to_path, file)
+    # Find csv files in the extracted files, leaving out extracts of archives that are no longer in scope
+    for file in extracted:
+        if file.endswith(".csv"):
+            csv_path = os.path.join(extract_to_path, file)
 
-        # Load the CSV file and append DataFrame to the list
-        dfs.append(pd.read_csv(csv_path, names=['id', 'price', 'qty', 'quoteQty', 'time', 'isBuyerMaker', 'isBestMatch']))
+            # Load the CSV file and append DataFrame to the list
+            dfs.append(pd.read_csv(csv_path, names=trade_columns))
 
-# Concatenate all DataFrames in the list along the column axis
-df = pd.concat(dfs, axis=0)
+    # Concatenate all DataFrames in the list along the column axis
+    df = pd.concat(dfs, axis=0)
 
 
-# Save the DataFrame to a single CSV file
-df.to_csv('Data/binance.csv', index=False)
+    # Save the DataFrame to a single CSV file
+    df.to_csv('Data/binance.csv', index=False)
@@ -1,9 +1,15 @@
 #Script taken from the binance github repository to download-trades: https://github.com/binance/binance-public-data/blob/master/python/README.md
 import os, sys, re, shutil
 import json
+import hashlib
 from pathlib import Path
 from datetime import *
 import urllib.request
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from tqdm import tqdm
 from argparse import ArgumentParser, RawTextHelpFormatter, ArgumentTypeError
 from enums import *
 
@@ -70,6 +76,136 @@ def download_file(base_path, file_name, date_range=None, folder=None):
     print("\nFile not found: {}".format(download_url))
     pass
 
+def get_save_path(base_path, file_name, date_range=None, folder=None):
+  if folder:
+    base_path = os.path.join(folder, base_path)
+  if date_range:
+    date_range = date_range.replace(" ","_")
+    base_path = os.path.join(base_path, date_range)
+  return get_destination_dir(os.path.join(base_path, file_name), folder)
+
+def get_session(pool_size=8):
+  """Session with a keep-alive connection pool of pool_size connections and retries on transient errors."""
+  session = requests.Session()
+  retry = Retry(total=5, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504])
+  adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+  session.mount('https://', adapter)
+  session.mount('http://', adapter)
+  return session
+
+def fetch_checksum(session, download_path, save_path=None, local_only=False):
+  """
+  Returns the SHA-256 published in the .CHECKSUM file next to download_path, or None if there is none.
+  The CHECKSUM file downloaded next to save_path is read instead of requesting it again when there is one, and
+  with local_only (the CHECKSUM file was just requested) only that file is read.
+  """
+  if save_path and os.path.exists(save_path + '.CHECKSUM'):
+    with open(save_path + '.CHECKSUM', 'r') as checksum_file:
+      text = checksum_file.read()
+  elif local_only:
+    return None
+  else:
+    response = session.get(get_download_url(download_path + '.CHECKSUM'), timeout=60)
+    if response.status_code != 200:
+      return None
+    text = response.text
+  return text.split()[0].lower() if text.split() else None
+
+def fetch_file(session, base_path, file_name, date_range=None, folder=None, verify=True, local_checksum=False, chunk_size=1 << 20, pbar=None):
+  """
+  Downloads one archive through a pooled session, resuming partial downloads.
+
+  Bytes are streamed to '<file>.part', hashed with SHA-256 as they are written. A leftover part is hashed and
+  continued with an HTTP Range request. The part is renamed to the final file only once the download is complete
+  and, when verify is set, its digest matches the published CHECKSUM file (the local copy when it was downloaded
+  first, only that copy with local_checksum); a mismatching part is deleted.
+
+  Returns:
+    str: 'exists', 'downloaded', 'unverified' (downloaded, but no CHECKSUM file is published), 'missing' (no such
+    archive) or 'corrupt' (checksum mismatch).
+  """
+  download_path = "{}{}".format(base_path, file_name)
+  save_path = get_save_path(base_path, file_name, date_range, folder)
+  if os.path.exists(save_path):
+    return 'exists'
+  Path(os.path.dirname(save_path)).mkdir(parents=True, exist_ok=True)
+
+  part_path = save_path + '.part'
+  sha256 = hashlib.sha256()
+  offset = 0
+  if os.path.exists(part_path):
+    with open(part_path, 'rb') as part_file:
+      for buf in iter(lambda: part_file.read(chunk_size), b''):
+        sha256.update(buf)
+        offset += len(buf)
+
+  headers = {'Range': 'bytes={}-'.format(offset)} if offset else {}
+  with session.get(get_download_url(download_path), headers=headers, stream=True, timeout=60) as response:
+    if response.status_code == 404:
+      return 'missing'
+    if response.status_code == 416:
+      # The part already holds the whole file
+      pass
+    else:
+      response.raise_for_status()
+      if response.status_code != 206:
+        # Range ignored by the server, start over
+        sha256, offset = hashlib.sha256(), 0
+      with open(part_path, 'ab' if offset else 'wb') as out_file:
+        for buf in response.iter_content(chunk_size):
+          sha256.update(buf)
+          out_file.write(buf)
+          if pbar is not None:
+            pbar.update(len(buf))
+
+  status = 'downloaded'
+  if verify:
+    expected = fetch_checksum(session, download_path, save_path, local_only=local_checksum)
+    if expected is None:
+      status = 'unverified'
+    elif expected != sha256.hexdigest():
+      os.remove(part_path)
+      return 'corrupt'
+  os.replace(part_path, save_path)
+  return status
+
+def download_files(jobs, max_workers=8, verify=True):
+  """
+  Downloads many archives concurrently over one connection pool.
+
+  The .CHECKSUM files among the jobs are downloaded first and are not verified themselves; the archives are then
+  verified against these local copies, so no checksum is requested twice.
+
+  Args:
+    jobs (list): (base_path, file_name, date_range, folder) tuples, as passed to fetch_file.
+    max_workers (int): Number of concurrent downloads, also the size of the connection pool.
+    verify (bool): Check every archive against its published SHA-256 checksum.
+
+  Returns:
+    dict: Download status (see fetch_file) by file name.
+  """
+  session = get_session(max_workers)
+  results = {}
+  checksum_jobs = [job for job in jobs if job[1].endswith('.CHECKSUM')]
+  archive_jobs = [job for job in jobs if not job[1].endswith('.CHECKSUM')]
+  checksum_names = set(job[1] for job in checksum_jobs)
+  with tqdm(unit='B', unit_scale=True, desc='Downloading {} files'.format(len(jobs))) as pbar, \
+      ThreadPoolExecutor(max_workers=max_workers) as executor:
+    for batch, verify_batch in ((checksum_jobs, False), (archive_jobs, verify)):
+      futures = {executor.submit(fetch_file, session, *job, verify=verify_batch, local_checksum=job[1] + '.CHECKSUM' in checksum_names,
+                                 pbar=pbar): job[1] for job in batch}
+      for future in as_completed(futures):
+        file_name = futures[future]
+        try:
+          results[file_name] = future.result()
+        except requests.RequestException as e:
+          results[file_name] = 'failed'
+          print("\nDownload failed: {} ({})".format(file_name, e))
+        if results[file_name] in ('missing', 'corrupt', 'unverified'):
+          print("\nDownload {}: {}".format(results[file_name], file_name))
+  session.close()
+  return results
+
 def convert_to_date_object(d):
   year, month, day = [int(x) for x in d.split('-')]
   date_obj = date(year, month, day)
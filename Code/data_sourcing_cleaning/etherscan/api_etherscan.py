@@ -7,22 +7,46 @@ It loads API keys from an environment file, reads transaction hashes from
 fetch transaction details. The results are saved in 'Data/all_etherscan/WBTC-WETH_etherscan_XXX.json'.
 
 Prerequisites:
-- A '.env' file with 'ETHERSCAN_KEY'.
-- A Data/WBTC-WETH.json file with extracts from the Uniswap API.
+- A '.env' file with 'ETHERSCAN_KEY', or 'ETHERSCAN_KEYS' with a comma separated pool of keys.
+- A Data/WBTC-WETH.json file with extracts from the Uniswap API, or the Data/WBTC-WETH Parquet files when
+  UNISWAP_OUTPUT is 'columnar' in the run config.
 
 Usage:
 Run as a standalone script to process and save Ethereum transaction data.
+With USE_LEDGER, hashes and results are tracked in 'Data/etherscan_ledger.sqlite' instead of chunk files:
+a restart resumes from the pending hashes and no hash is requested twice. With RETRY_FAILED, the hashes that
+failed in earlier runs (network errors, 5xx, retries used up) are requested again; hashes Etherscan returned
+nothing for are only requested again with RETRY_NOT_FOUND.
+Set FETCH_MODE to 'async' to fetch through the asyncio client (shared token bucket, keep-alive connections),
+'blocks' to resolve transactions from whole blocks (one call per distinct block instead of one per transaction,
+grouped by the block numbers of the Uniswap extract),
+or 'sync' for the original rate limited loop.
 """
 
 import os
 import json
+import asyncio
 import ratelimit
 import requests
 import time
 import glob
 import threading
+import pandas as pd
 from tqdm import tqdm
 from dotenv import load_dotenv
+import random
+from etherscan_client import EtherscanClient, fetch_transactions, resolve_block_numbers, fetch_blocks, is_rate_limited
+from fetch_ledger import FetchLedger, LEDGER_PATH
+
+# Fetch mode: 'async' (asyncio client), 'blocks' (asyncio client, block level) or 'sync' (requests + ratelimit decorator)
+FETCH_MODE = 'async'
+BLOCKS_CACHE_DIR = 'Data/etherscan_blocks'
+RATE_LIMIT = 5  # Requests per second allowed by each API key
+MAX_IN_FLIGHT = 10  # Concurrent connections used by the asyncio client
+USE_LEDGER = True  # Track fetched, failed and pending hashes in the SQLite ledger
+RETRY_FAILED = True  # Move the hashes the ledger recorded as failed back to pending at startup
+RETRY_NOT_FOUND = False  # Also move the hashes Etherscan returned nothing for back to pending (with RETRY_FAILED)
+COLUMNAR_DIRECTORY = 'Data/WBTC-WETH'  # Uniswap Parquet files, one per tier and type
 
 # Directory path
 out_directory = 'Data/all_etherscan'
@@ -41,11 +65,30 @@ def load_env_variables(env_file):
         raise Exception("ETHERSCAN_KEY not found in the environment variables.")
     return etherscan_key
 
+def load_api_keys(env_file):
+    """Load the pool of API keys: ETHERSCAN_KEYS (comma separated) if set, otherwise ETHERSCAN_KEY."""
+    if not load_dotenv(env_file):
+        raise Exception(f"Failed to load environment file: {env_file}")
+
+    etherscan_keys = [key.strip() for key in os.getenv("ETHERSCAN_KEYS", "").split(",") if key.strip()]
+    if not etherscan_keys:
+        etherscan_keys = [load_env_variables(env_file)]
+    return etherscan_keys
+
 def read_data(file_path):
     """Read data from a JSON file."""
     with open(file_path, "r") as file:
         return json.load(file)
 
+def read_columnar_data(directory):
+    """Read the id, timestamp and block number columns of the Uniswap Parquet files into the tiers structure of the JSON extract."""
+    tiers = {}
+    for path in sorted(glob.glob(os.path.join(directory, "*.parquet"))):
+        tier, lp_type = os.path.basename(path)[:-len(".parquet")].split('_')
+        df = pd.read_parquet(path, columns=['id', 'timestamp', 'transaction.blockNumber'])
+        tiers.setdefault(tier, {})[lp_type] = df.to_dict('records')
+    return tiers
+
 def extract_transaction_hashes(tiers):
     """Extract transaction hashes from tiers data."""
     transactions = []
@@ -54,6 +97,27 @@ def extract_transaction_hashes(tiers):
             transactions.extend(tiers[tier][lp_type])
     return [tx["id"] for tx in transactions]
 
+def extract_transaction_timestamps(tiers):
+    """Extract the timestamp of each transaction hash from tiers data."""
+    timestamps = {}
+    for tier in tiers:
+        for lp_type in tiers[tier]:
+            for tx in tiers[tier][lp_type]:
+                timestamps[tx["id"].split('#')[0]] = int(tx["timestamp"])
+    return timestamps
+
+def extract_transaction_blocks(tiers):
+    """Extract the block number of each transaction hash from tiers data, for the events the subgraph returned it for."""
+    blocks = {}
+    for tier in tiers:
+        for lp_type in tiers[tier]:
+            for tx in tiers[tier][lp_type]:
+                # Nested in the JSON extract, flattened in the Parquet files
+                block_number = tx["transaction"].get("blockNumber") if "transaction" in tx else tx.get("transaction.blockNumber")
+                if block_number is not None and not pd.isna(block_number):
+                    blocks[tx["id"].split('#')[0]] = int(block_number)
+    return blocks
+
 # Define the rate limit decorator
 @ratelimit.limits(calls=5, period=1)  # 1 requests per second
 def make_api_request(api_endpoint, params):
@@ -65,10 +129,11 @@ def log_failed_request(response):
     with open(f"Data/failed/WBTC-WETH_etherscan-{timestr}.json", "w") as file:
         json.dump(response.json(), file)
 
-def process_transactions(transaction_hashes, etherscan_key):
+def process_transactions(transaction_hashes, etherscan_key, failed_archive=None):
     """Process each transaction and fetch details."""
     etherscan_transaction = {}
-    failed_archive = load_failed_transactions()
+    if failed_archive is None:
+        failed_archive = load_failed_transactions()
     with tqdm(total=len(transaction_hashes), desc="Fetching transaction details") as pbar:
         for tx_id in transaction_hashes:
             txhash = tx_id.split('#')[0]
@@ -93,14 +158,38 @@ def save_to_json(data, file_path):
     with open(file_path, "w") as file:
         json.dump(data, file)
 
+def save_chunk(etherscan_transaction, chunk_id, requested=(), failed=None, ledger=None):
+    """
+    Persist the result of a chunk.
+
+    With a ledger, payloads and failures are recorded against their hashes, and requested hashes Etherscan
+    returned nothing for are marked not found so they are not requested again. Without one, the chunk is
+    written to its JSON file and failures are logged.
+    """
+    failed = dict(failed or {})
+    if ledger:
+        ledger.record_fetched(etherscan_transaction)
+        ledger.record_failed(failed)
+        ledger.record_not_found([txhash for txhash in requested if txhash not in etherscan_transaction and txhash not in failed])
+    else:
+        save_to_json(etherscan_transaction, f"{out_directory}/WBTC-WETH_etherscan_{chunk_id:05d}.json")
+        if failed:
+            log_failed_transactions(failed)
+
 def get_transaction_details(txhash, api_key):
     """Retrieve transaction details from Etherscan API."""
     base_url = "https://api.etherscan.io/api"
     params = {"module": "proxy", "action": "eth_getTransactionByHash", "txhash": txhash, "apikey": api_key}
-    
+    throttled = 0
+
     while True:
         try:
             response = make_api_request(base_url, params)
+            if response.status_code == 200 and is_rate_limited(response.json()):
+                # Soft rate limit: back off exponentially with jitter before retrying
+                throttled += 1
+                time.sleep(min(60, 2 ** (throttled - 1)) * random.uniform(0.5, 1.5))
+                continue
             if response.status_code == 200:
                 return response.json()["result"]
             else:
@@ -111,12 +200,11 @@ def get_transaction_details(txhash, api_key):
             time.sleep(1)  # Wait for 1 second before retrying
             continue
 
-def process_and_save_chunk(chunk, chunk_id, etherscan_key, semaphore=None):
+def process_and_save_chunk(chunk, chunk_id, etherscan_key, semaphore=None, ledger=None, failed_archive=None):
 
     def process_and_save_logic(chunk, chunk_id, etherscan_key):
-        etherscan_transaction = process_transactions(chunk, etherscan_key)
-        filename = f"{out_directory}/WBTC-WETH_etherscan_{chunk_id:05d}.json"
-        save_to_json(etherscan_transaction, filename)
+        etherscan_transaction = process_transactions(chunk, etherscan_key, failed_archive)
+        save_chunk(etherscan_transaction, chunk_id, [tx_id.split('#')[0] for tx_id in chunk], ledger=ledger)
 
     # Execute the block within semaphore context only if semaphore is not None
     if semaphore:
@@ -126,21 +214,148 @@ def process_and_save_chunk(chunk, chunk_id, etherscan_key, semaphore=None):
         # If no semaphore, just execute the logic directly
         process_and_save_logic(chunk, chunk_id, etherscan_key)
 
+def log_failed_transactions(failed):
+    """Log transactions that failed in the asyncio client, keyed by hash."""
+    os.makedirs("Data/failed", exist_ok=True)
+    timestr = time.strftime("%Y%m%d-%H%M%S")
+    with open(f"Data/failed/WBTC-WETH_etherscan-{timestr}.json", "w") as file:
+        json.dump(failed, file)
+
+def update_progress(pbar, client):
+    """Advance a progress bar and show the achieved request rate of the client."""
+    pbar.update(1)
+    pbar.set_postfix(rps=f"{client.achieved_rate():.2f}", throttled=client.throttled, refresh=False)
+
+async def process_chunks_async(transaction_hashes, etherscan_keys, chunk_size, skip_until_chunk_id=0, ledger=None):
+    """
+    Fetch and save all chunks through a single asyncio client.
+
+    Every request of every chunk shares one token bucket and one connection pool, so the API is kept at
+    RATE_LIMIT requests per second per key for the whole run. Results are saved as in process_and_save_chunk.
+    """
+    failed_archive = {} if ledger else load_failed_transactions()
+    async with EtherscanClient(etherscan_keys, rate=RATE_LIMIT, max_in_flight=MAX_IN_FLIGHT) as client:
+        for i in range(0, len(transaction_hashes), chunk_size):
+            chunk_id = i // chunk_size + 1
+            if chunk_id <= skip_until_chunk_id:
+                continue  # Skip this chunk
+
+            chunk = transaction_hashes[i:i + chunk_size]
+            txhashes = list(dict.fromkeys(tx_id.split('#')[0] for tx_id in chunk))
+            txhashes = [txhash for txhash in txhashes if txhash not in failed_archive]
+
+            with tqdm(total=len(txhashes), desc=f"Fetching transaction details (chunk {chunk_id})") as pbar:
+                etherscan_transaction, failed = await fetch_transactions(client, txhashes, on_done=lambda: update_progress(pbar, client))
+
+            save_chunk(etherscan_transaction, chunk_id, txhashes, failed, ledger)
+
+async def process_blocks_async(transaction_timestamps, etherscan_keys, chunk_size, ledger=None, transaction_blocks=None):
+    """
+    Resolve transactions from whole blocks rather than one lookup per transaction.
+
+    Hashes are grouped by the block number the subgraph returned with their event. Only the events without one have
+    their timestamp mapped to a block (one call per distinct timestamp, cached). The distinct blocks are fetched with
+    their full transactions (cached on disk), so a block costs a single call however many events it holds, and
+    transactions are joined locally by hash. Hashes missing from their block fall back to eth_getTransactionByHash.
+    Results are saved as in process_and_save_chunk, with one chunk per chunk_size blocks.
+
+    Args:
+        transaction_timestamps (dict): Transaction hash -> event timestamp.
+        etherscan_keys (list): Pool of Etherscan API keys.
+        chunk_size (int): Number of blocks per output file.
+        ledger (FetchLedger): Optional ledger to record results in.
+        transaction_blocks (dict): Transaction hash -> block number, for the events the subgraph returned it for.
+    """
+    transaction_blocks = transaction_blocks or {}
+    os.makedirs(BLOCKS_CACHE_DIR, exist_ok=True)
+    async with EtherscanClient(etherscan_keys, rate=RATE_LIMIT, max_in_flight=MAX_IN_FLIGHT) as client:
+        hashes_by_block = {}
+        for txhash in transaction_timestamps:
+            if txhash in transaction_blocks:
+                hashes_by_block.setdefault(transaction_blocks[txhash], set()).add(txhash)
+
+        # Map the timestamps of the events without a block number to their blocks
+        untracked = {txhash: timestamp for txhash, timestamp in transaction_timestamps.items() if txhash not in transaction_blocks}
+        timestamps = set(untracked.values())
+        block_by_time = {}
+        if timestamps:
+            with tqdm(total=len(timestamps), desc="Resolving block numbers") as pbar:
+                block_by_time = await resolve_block_numbers(client, timestamps, os.path.join(BLOCKS_CACHE_DIR, "block_by_time.json"),
+                                                            on_done=lambda: update_progress(pbar, client))
+
+        unresolved = []
+        for txhash, timestamp in untracked.items():
+            if timestamp in block_by_time:
+                hashes_by_block.setdefault(block_by_time[timestamp], set()).add(txhash)
+            else:
+                unresolved.append(txhash)
+
+        block_numbers = sorted(hashes_by_block)
+        for i in range(0, len(block_numbers), chunk_size):
+            chunk_id = i // chunk_size + 1
+            chunk = block_numbers[i:i + chunk_size]
+
+            with tqdm(total=len(chunk), desc=f"Fetching blocks (chunk {chunk_id})") as pbar:
+                blocks, failed_blocks = await fetch_blocks(client, chunk, BLOCKS_CACHE_DIR, on_done=lambda: update_progress(pbar, client))
+
+            etherscan_transaction = {}
+            for block_number, block in blocks.items():
+                wanted = hashes_by_block[block_number]
+                for tx in block["transactions"]:
+                    if tx["hash"] in wanted:
+                        etherscan_transaction[tx["hash"]] = tx
+            unresolved += [txhash for block_number in chunk for txhash in hashes_by_block[block_number] if txhash not in etherscan_transaction]
+
+            save_chunk(etherscan_transaction, chunk_id, ledger=ledger)
+
+        # Fall back to per transaction lookups for anything the blocks did not resolve
+        if unresolved:
+            chunk_id = len(block_numbers) // chunk_size + 2
+            with tqdm(total=len(unresolved), desc="Fetching unresolved transactions") as pbar:
+                etherscan_transaction, failed = await fetch_transactions(client, unresolved, on_done=lambda: update_progress(pbar, client))
+            save_chunk(etherscan_transaction, chunk_id, unresolved, failed, ledger)
+
 # Main execution
 if __name__ == "__main__":
     env_file = 'environment/local-secrets.env'
-    etherscan_key = load_env_variables(env_file)
-    print("ETHERSCAN_KEY successfully loaded.")
+    etherscan_keys = load_api_keys(env_file)
+    etherscan_key = etherscan_keys[0] # The sync path uses a single key
+    print(f"{len(etherscan_keys)} Etherscan key(s) successfully loaded.")
 
-    tiers = read_data("Data/WBTC-WETH.json")
+    load_dotenv('environment/run-config.env')
+    if os.getenv("UNISWAP_OUTPUT", "json").strip() == 'columnar':
+        tiers = read_columnar_data(COLUMNAR_DIRECTORY)
+    else:
+        tiers = read_data("Data/WBTC-WETH.json")
     transaction_hashes = extract_transaction_hashes(tiers)
 
     chunk_size = 1000
     max_threads = 1 # Set to 1 to avoid rate limit issues; increase if rate limit is not an issue
     threads = []
-    skip_until_chunk_id = 0
+    skip_until_chunk_id = 0 # Only used without the ledger, which resumes by itself
+    ledger = None
+    failed_archive = None
 
-    if max_threads > 1: # Use threading
+    if USE_LEDGER:
+        ledger = FetchLedger(LEDGER_PATH)
+        ledger.register(transaction_hashes)
+        if RETRY_FAILED:
+            ledger.retry_failed(include_not_found=RETRY_NOT_FOUND)
+        transaction_hashes = ledger.pending()
+        failed_archive = {} # The ledger only hands out pending hashes, the failed logs are not read
+        print("Ledger status:", ledger.counts())
+    else:
+        failed_archive = load_failed_transactions()
+
+    if FETCH_MODE == 'blocks':
+        transaction_timestamps = extract_transaction_timestamps(tiers)
+        if ledger:
+            pending = set(transaction_hashes)
+            transaction_timestamps = {txhash: timestamp for txhash, timestamp in transaction_timestamps.items() if txhash in pending}
+        asyncio.run(process_blocks_async(transaction_timestamps, etherscan_keys, chunk_size, ledger, extract_transaction_blocks(tiers)))
+    elif FETCH_MODE == 'async':
+        asyncio.run(process_chunks_async(transaction_hashes, etherscan_keys, chunk_size, skip_until_chunk_id, ledger))
+    elif max_threads > 1: # Use threading
         threads = []
         semaphore = threading.Semaphore(max_threads)
 
@@ -150,7 +365,7 @@ if __name__ == "__main__":
                 continue  # Skip this chunk
 
             chunk = transaction_hashes[i:i + chunk_size]
-            thread = threading.Thread(target=process_and_save_chunk, args=(chunk, chunk_id, etherscan_key, semaphore))
+            thread = threading.Thread(target=process_and_save_chunk, args=(chunk, chunk_id, etherscan_key, semaphore, ledger, failed_archive))
             threads.append(thread)
             thread.start()
 
@@ -164,7 +379,11 @@ if __name__ == "__main__":
                 continue  # Skip this chunk
 
             chunk = transaction_hashes[i:i + chunk_size]
-            process_and_save_chunk(chunk, chunk_id, etherscan_key, None)
+            process_and_save_chunk(chunk, chunk_id, etherscan_key, None, ledger, failed_archive)
 
     for thread in threads:
         thread.join()
+
+    if ledger:
+        print("Ledger status:", ledger.counts())
+        ledger.close()
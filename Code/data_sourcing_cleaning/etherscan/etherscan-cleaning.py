@@ -1,26 +1,89 @@
 import os
+import sys
 import json
 import glob
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+
+sys.path.append(os.getcwd())
+
+from fetch_ledger import FetchLedger, LEDGER_PATH
+from environment.hex_columns import decode_hex_columns
+from environment.storage import write_dataset
 
 # Directory path
 out_directory = 'Data/cleansed'
 
-# Check if the directory exists, if not, create it
-if not os.path.exists(out_directory):
-    os.makedirs(out_directory)
+# Transaction fields returned by eth_getTransactionByHash
+ETHERSCAN_COLUMNS = ['blockHash', 'blockNumber', 'from', 'gas', 'gasPrice', 'maxFeePerGas', 'maxPriorityFeePerGas',
+                     'hash', 'input', 'nonce', 'to', 'transactionIndex', 'value', 'type', 'accessList', 'chainId',
+                     'v', 'r', 's']
+
+# Fields kept in the cleansed output unless ETHERSCAN_COLUMNS is set in run-config.env; the large input, signature
+# and accessList payloads are not used downstream
+DEFAULT_COLUMNS = ['hash', 'blockNumber', 'from', 'to', 'gas', 'gasPrice', 'maxFeePerGas', 'maxPriorityFeePerGas',
+                   'nonce', 'transactionIndex', 'type']
+
+CONSOLIDATION_WORKERS = os.cpu_count()
+
+
+def load_columns(env_file='environment/run-config.env'):
+    """Columns to keep, from ETHERSCAN_COLUMNS (comma separated) or DEFAULT_COLUMNS."""
+    load_dotenv(env_file)
+    columns = [column.strip() for column in os.getenv("ETHERSCAN_COLUMNS", "").split(",") if column.strip()]
+    unknown = set(columns) - set(ETHERSCAN_COLUMNS)
+    if unknown:
+        raise Exception(f"Unknown Etherscan columns in ETHERSCAN_COLUMNS: {sorted(unknown)}")
+    columns = columns or DEFAULT_COLUMNS
+    # The hash is the key the Uniswap events are joined on
+    return columns if 'hash' in columns else ['hash'] + columns
+
+
+def project_transactions(transactions, columns):
+    """Build a DataFrame of the given columns from transaction payloads, with the hex quantities decoded."""
+    return decode_hex_columns(pd.DataFrame(transactions).reindex(columns=columns))
 
-file_pattern = "Data/all_etherscan/WBTC-WETH_etherscan*.json"  # Update the pattern to match your file naming convention
-data = {}
-# Iterate over the matched files
-for file_name in glob.glob(file_pattern):
+
+def load_chunk(file_name, columns):
+    """Load one WBTC-WETH_etherscan_XXX.json chunk file as a projected, decoded DataFrame."""
     with open(file_name, "r") as file:
-        # Load the JSON data from each file and append it to the failed_archive list
-        ind_data = json.load(file)
-        data.update(ind_data)
+        return project_transactions(list(json.load(file).values()), columns)
+
+
+def main():
+    # Check if the directory exists, if not, create it
+    if not os.path.exists(out_directory):
+        os.makedirs(out_directory)
+
+    columns = load_columns()
+
+    if os.path.exists(LEDGER_PATH):
+        # Stream the fetched transactions straight from the ledger, one batch at a time
+        ledger = FetchLedger(LEDGER_PATH)
+        print("Ledger status:", ledger.counts())
+        append = False
+        for batch in ledger.iter_fetched():
+            write_dataset(project_transactions(batch, columns), 'etherscan', append=append)
+            append = True
+        if not append:
+            write_dataset(pd.DataFrame(columns=columns), 'etherscan')
+        ledger.close()
+    else:
+        file_pattern = "Data/all_etherscan/WBTC-WETH_etherscan*.json"  # Update the pattern to match your file naming convention
+        file_names = sorted(glob.glob(file_pattern))
+
+        # Load, project and decode the chunk files in parallel; only the kept columns travel back
+        with ProcessPoolExecutor(max_workers=CONSOLIDATION_WORKERS) as executor:
+            chunks = list(executor.map(load_chunk, file_names, [columns] * len(file_names)))
+        df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=columns)
+
+        # A hash fetched in several chunks keeps its last payload, as when the chunks were merged into one dict
+        df = df.drop_duplicates(subset='hash', keep='last', ignore_index=True)
+
+        # Save the DataFrame as the cleansed etherscan dataset
+        write_dataset(df, 'etherscan')
 
-# Convert the dictionary to a DataFrame
-df = pd.DataFrame(data.values())
 
-# Save the DataFrame to a CSV file
-df.to_csv(f'{out_directory}/etherscan.csv', index=False)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+"""
+Asynchronous Etherscan Client
+
+All in-flight requests share a single token bucket and a single keep-alive connection pool, so the API is
+driven at its allowed rate instead of alternating between bursts and one second stalls. An AIMD controller
+watches for Etherscan's soft rate limit responses (HTTP 200 with a "Max rate limit reached" result), backs off
+exponentially with jitter and then probes the rate back up to the key's maximum.
+
+Several API keys can be pooled: each key gets its own bucket and controller, and requests queue once for the
+whole pool and take whichever key has a token first, so a throttled key is bypassed and throughput grows with the
+number of keys.
+
+Usage:
+    async with EtherscanClient([api_key_1, api_key_2], rate=5) as client:
+        tx = await client.get_transaction(txhash)
+"""
+
+import os
+import gzip
+import json
+import random
+import asyncio
+import time
+import aiohttp
+from collections import deque
+
+ETHERSCAN_URL = "https://api.etherscan.io/api"
+
+
+class EtherscanError(Exception):
+    """Raised when Etherscan answers with an error status or payload."""
+
+
+def is_rate_limited(payload):
+    """Return True for Etherscan's soft rate limit payloads, which arrive with HTTP status 200."""
+    if not isinstance(payload, dict):
+        return False
+    result = payload.get("result")
+    return payload.get("status") == "0" and isinstance(result, str) and "rate limit" in result.lower()
+
+
+class TokenBucket:
+    """
+    Token bucket shared by every coroutine of a client.
+
+    Tokens refill continuously at `rate` per second up to `capacity`. Callers queue on a FIFO lock and only the
+    head of the queue waits for the next token, recomputing its wait from the current rate, so concurrent callers
+    leave at exactly 1/rate second intervals and a rate change applies to the whole queue at once.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            while not self.try_acquire():
+                await asyncio.sleep(self.time_to_token())
+
+    def try_acquire(self):
+        """Take a token if one is available, without waiting."""
+        self._refill()
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def time_to_token(self):
+        """Seconds until the next token is available at the current rate."""
+        self._refill()
+        return max(0, 1 - self._tokens) / self.rate
+
+    def pause(self, seconds):
+        """Hold back every caller for the given number of seconds."""
+        self._refill()
+        self._tokens = min(self._tokens, 0) - seconds * self.rate
+
+
+class RateController:
+    """
+    Additive increase / multiplicative decrease controller driving a TokenBucket.
+
+    Each successful request raises the rate so that it grows by about `increase` requests per second every
+    second, up to `max_rate`. A soft rate limit response multiplies the rate by `decrease` and pauses the
+    bucket for an exponential backoff with jitter, which grows with consecutive throttles. Throttles of requests
+    sent before the last decrease only confirm it, so a burst of throttled responses counts as a single event.
+
+    Args:
+        bucket (TokenBucket): The bucket whose rate is controlled.
+        max_rate (float): Ceiling for the rate, usually the key's quota.
+        min_rate (float): Floor for the rate.
+        increase (float): Additive increase in requests per second, per second.
+        decrease (float): Multiplicative decrease applied on throttling.
+        base_backoff (float): Backoff in seconds after the first throttle.
+        max_backoff (float): Cap on the backoff in seconds.
+        window (float): Window in seconds for the achieved rate metric.
+    """
+
+    def __init__(self, bucket, max_rate, min_rate=0.5, increase=0.5, decrease=0.5, base_backoff=1.0, max_backoff=60.0, window=10.0):
+        self.bucket = bucket
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.window = window
+        self.throttled = 0
+        self.epoch = 0
+        self._consecutive = 0
+        self._successes = deque()
+
+    @property
+    def rate(self):
+        return self.bucket.rate
+
+    def on_success(self):
+        self._consecutive = 0
+        self.bucket.rate = min(self.max_rate, self.bucket.rate + self.increase / self.bucket.rate)
+        now = time.monotonic()
+        self._successes.append(now)
+        while self._successes[0] < now - self.window:
+            self._successes.popleft()
+
+    def on_throttle(self, epoch):
+        """
+        Register a soft rate limit response for a request sent during `epoch`.
+
+        Returns:
+            float: The backoff applied in seconds, 0 if the request was sent before the last decrease.
+        """
+        self.throttled += 1
+        if epoch != self.epoch:
+            return 0
+        self.epoch += 1
+        self._consecutive += 1
+        self.bucket.rate = max(self.min_rate, self.bucket.rate * self.decrease)
+        backoff = min(self.max_backoff, self.base_backoff * 2 ** (self._consecutive - 1)) * random.uniform(0.5, 1.5)
+        self.bucket.pause(backoff)
+        return backoff
+
+    def achieved_rate(self):
+        """Successful requests per second over the last `window` seconds."""
+        now = time.monotonic()
+        while self._successes and self._successes[0] < now - self.window:
+            self._successes.popleft()
+        return len(self._successes) / self.window
+
+
+class KeyLane:
+    """An API key with its own token bucket and rate controller."""
+
+    def __init__(self, api_key, rate):
+        self.api_key = api_key
+        self.bucket = TokenBucket(rate)
+        self.controller = RateController(self.bucket, max_rate=rate)
+
+
+class EtherscanClient:
+    """
+    Rate limited Etherscan client over a pooled keep-alive HTTP session.
+
+    Args:
+        api_keys (str or list): Etherscan API key, or a pool of keys.
+        rate (float): Requests per second allowed for each key.
+        max_in_flight (int): Maximum number of concurrent connections per key.
+        url (str): API endpoint.
+        max_retries (int): Soft rate limit responses tolerated per request before giving up.
+    """
+
+    def __init__(self, api_keys, rate=5, max_in_flight=10, url=ETHERSCAN_URL, max_retries=8):
+        if isinstance(api_keys, str):
+            api_keys = [api_keys]
+        self.lanes = [KeyLane(api_key, rate) for api_key in api_keys]
+        self._lock = asyncio.Lock()
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.url = url
+        self.session = None
+
+    @property
+    def throttled(self):
+        """Number of soft rate limit responses received across all keys."""
+        return sum(lane.controller.throttled for lane in self.lanes)
+
+    def achieved_rate(self):
+        """Successful requests per second across all keys."""
+        return sum(lane.controller.achieved_rate() for lane in self.lanes)
+
+    async def acquire_lane(self):
+        """
+        Wait for a token from any key and return the key it came from.
+
+        Callers queue on one FIFO lock for the whole pool and the head of the queue takes the first key with a
+        token, so requests are never stuck behind a key that is backing off while other keys are free.
+        """
+        async with self._lock:
+            while True:
+                for lane in self.lanes:
+                    if lane.bucket.try_acquire():
+                        return lane
+                await asyncio.sleep(min(lane.bucket.time_to_token() for lane in self.lanes))
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.max_in_flight * len(self.lanes), keepalive_timeout=60)
+        self.session = aiohttp.ClientSession(connector=connector)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+
+    async def request(self, params):
+        """
+        Send one rate limited GET request and return the decoded JSON payload.
+
+        A soft rate limit backs off the key that received it and the request is retried on whichever key
+        is then available first. A body that is not a JSON object raises EtherscanError.
+        """
+        for _ in range(self.max_retries + 1):
+            lane = await self.acquire_lane()
+            epoch = lane.controller.epoch
+            async with self.session.get(self.url, params={**params, "apikey": lane.api_key}) as response:
+                if response.status != 200:
+                    raise EtherscanError(f"Request failed with status code: {response.status}")
+                try:
+                    payload = await response.json(content_type=None)
+                except ValueError as e:
+                    raise EtherscanError(f"Invalid JSON response: {e}")
+            if not isinstance(payload, dict):
+                raise EtherscanError(f"Unexpected response: {payload!r}")
+            if not is_rate_limited(payload):
+                lane.controller.on_success()
+                return payload
+            lane.controller.on_throttle(epoch)
+        raise EtherscanError(f"Rate limited {self.max_retries + 1} times in a row")
+
+    async def get_transaction(self, txhash):
+        """Retrieve transaction details with eth_getTransactionByHash."""
+        payload = await self.request({"module": "proxy", "action": "eth_getTransactionByHash", "txhash": txhash})
+        if "error" in payload:
+            raise EtherscanError(payload["error"])
+        # A transaction, or None for an unknown hash; error bodies such as {"status": "0", "result": "Invalid API Key"}
+        # carry their message in result
+        result = payload.get("result")
+        if result is not None and not isinstance(result, dict):
+            raise EtherscanError(result)
+        return result
+
+    async def get_block_number_by_time(self, timestamp):
+        """Retrieve the number of the block mined at (or closest before) a timestamp."""
+        payload = await self.request({"module": "block", "action": "getblocknobytime", "timestamp": timestamp, "closest": "before"})
+        if payload.get("status") != "1":
+            raise EtherscanError(payload.get("result"))
+        return int(payload["result"])
+
+    async def get_block(self, block_number):
+        """Retrieve a block with its full transactions with eth_getBlockByNumber."""
+        payload = await self.request({"module": "proxy", "action": "eth_getBlockByNumber", "tag": hex(block_number), "boolean": "true"})
+        if "error" in payload or not payload.get("result"):
+            raise EtherscanError(payload.get("error", f"Block {block_number} not found"))
+        return payload["result"]
+
+
+async def fetch_transactions(client, txhashes, on_done=None):
+    """
+    Fetch many transactions concurrently through one client.
+
+    Args:
+        client (EtherscanClient): An open client.
+        txhashes (list): Transaction hashes to fetch.
+        on_done (callable): Optional callback invoked after each hash, e.g. to update a progress bar.
+
+    Returns:
+        Tuple[dict, dict]: Transactions by hash, and error messages by hash for the failed ones.
+    """
+    transactions, failed = {}, {}
+
+    async def fetch_one(txhash):
+        try:
+            tx = await client.get_transaction(txhash)
+            if tx:  # Ensure transaction data is not None
+                transactions[tx["hash"]] = tx
+        except (EtherscanError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            failed[txhash] = str(e)
+        if on_done:
+            on_done()
+
+    await asyncio.gather(*(fetch_one(txhash) for txhash in txhashes))
+    return transactions, failed
+
+
+async def resolve_block_numbers(client, timestamps, cache_path, on_done=None):
+    """
+    Map event timestamps to block numbers, caching the mapping in a JSON file.
+
+    Every block has its own timestamp, so one lookup per distinct timestamp resolves all the events mined in it.
+
+    Returns:
+        dict: Timestamp -> block number for every timestamp that could be resolved.
+    """
+    cache = {}
+    if os.path.exists(cache_path):
+        with open(cache_path, "r") as file:
+            cache = {int(k): v for k, v in json.load(file).items()}
+
+    async def resolve_one(timestamp):
+        try:
+            cache[timestamp] = await client.get_block_number_by_time(timestamp)
+        except (EtherscanError, aiohttp.ClientError, asyncio.TimeoutError):
+            pass
+        if on_done:
+            on_done()
+
+    await asyncio.gather(*(resolve_one(timestamp) for timestamp in set(timestamps) if timestamp not in cache))
+    with open(cache_path, "w") as file:
+        json.dump(cache, file)
+    return {timestamp: cache[timestamp] for timestamp in timestamps if timestamp in cache}
+
+
+async def fetch_blocks(client, block_numbers, cache_dir, on_done=None):
+    """
+    Fetch full blocks concurrently, reading and writing them as gzipped JSON in cache_dir.
+
+    Returns:
+        Tuple[dict, dict]: Blocks by number, and error messages by number for the failed ones.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    blocks, failed = {}, {}
+
+    async def fetch_one(block_number):
+        block_path = os.path.join(cache_dir, f"{block_number}.json.gz")
+        try:
+            if os.path.exists(block_path):
+                with gzip.open(block_path, "rt") as file:
+                    blocks[block_number] = json.load(file)
+            else:
+                block = await client.get_block(block_number)
+                with gzip.open(block_path, "wt") as file:
+                    json.dump(block, file)
+                blocks[block_number] = block
+        except (EtherscanError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            failed[block_number] = str(e)
+        if on_done:
+            on_done()
+
+    await asyncio.gather(*(fetch_one(block_number) for block_number in block_numbers))
+    return blocks, failed
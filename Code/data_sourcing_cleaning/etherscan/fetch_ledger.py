@@ -0,0 +1,114 @@
+"""
+Etherscan Fetch Ledger
+
+An embedded SQLite ledger recording the state of every transaction hash requested from Etherscan:
+'pending' until it is fetched, then 'fetched' (with the transaction payload), 'failed' (with the error) when the
+request failed (network errors, 5xx, retries used up), or 'not_found' when Etherscan returned nothing for the hash.
+Failed hashes can be retried on a later run; not found hashes are terminal unless a retry asks for them.
+
+Hashes are stored once, without the '#logIndex' suffix of Uniswap ids, so a hash is never requested twice and
+an interrupted run resumes from the remaining pending hashes. The cleaning script streams the fetched payloads
+straight from the ledger.
+"""
+
+import json
+import time
+import sqlite3
+import threading
+
+LEDGER_PATH = 'Data/etherscan_ledger.sqlite'
+
+PENDING = 'pending'
+FETCHED = 'fetched'
+FAILED = 'failed'
+NOT_FOUND = 'not_found'
+NOT_FOUND_ERROR = 'Transaction not found'
+
+
+class FetchLedger:
+    def __init__(self, path=LEDGER_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS transactions (
+                hash TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                payload TEXT,
+                error TEXT,
+                updated_at REAL
+            )""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS transactions_status ON transactions (status)")
+        # Ledgers written before the not_found status recorded the misses as failed
+        self._conn.execute("UPDATE transactions SET status = ? WHERE status = ? AND error = ?", (NOT_FOUND, FAILED, NOT_FOUND_ERROR))
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    def _write(self, statement, rows):
+        with self._lock:
+            self._conn.executemany(statement, rows)
+            self._conn.commit()
+
+    def register(self, transaction_ids):
+        """Add transaction ids as pending, dropping any '#logIndex' suffix. Known hashes keep their status."""
+        now = time.time()
+        txhashes = dict.fromkeys(tx_id.split('#')[0] for tx_id in transaction_ids)
+        self._write("INSERT OR IGNORE INTO transactions (hash, status, updated_at) VALUES (?, ?, ?)",
+                    [(txhash, PENDING, now) for txhash in txhashes])
+
+    def pending(self):
+        """Return the pending hashes in registration order."""
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT hash FROM transactions WHERE status = ? ORDER BY rowid", (PENDING,))]
+
+    def record_fetched(self, transactions):
+        """Mark hashes as fetched and store their payloads.
+
+        Args:
+            transactions (dict): Transaction payloads by hash.
+        """
+        now = time.time()
+        self._write("UPDATE transactions SET status = ?, payload = ?, error = NULL, updated_at = ? WHERE hash = ?",
+                    [(FETCHED, json.dumps(tx), now, txhash) for txhash, tx in transactions.items()])
+
+    def record_not_found(self, txhashes):
+        """Mark hashes Etherscan returned nothing for as not found, so they are not requested again."""
+        now = time.time()
+        self._write("UPDATE transactions SET status = ?, error = ?, updated_at = ? WHERE hash = ?",
+                    [(NOT_FOUND, NOT_FOUND_ERROR, now, txhash) for txhash in txhashes])
+
+    def record_failed(self, failed):
+        """Mark hashes whose request failed, which retry_failed can move back to pending.
+
+        Args:
+            failed (dict): Error messages by hash.
+        """
+        now = time.time()
+        self._write("UPDATE transactions SET status = ?, error = ?, updated_at = ? WHERE hash = ?",
+                    [(FAILED, str(error), now, txhash) for txhash, error in failed.items()])
+
+    def retry_failed(self, include_not_found=False):
+        """Move the failed hashes back to pending, and the not found ones too with include_not_found."""
+        statuses = (FAILED, NOT_FOUND) if include_not_found else (FAILED,)
+        with self._lock:
+            self._conn.execute(f"UPDATE transactions SET status = ?, error = NULL, updated_at = ? WHERE status IN ({', '.join('?' * len(statuses))})",
+                               (PENDING, time.time(), *statuses))
+            self._conn.commit()
+
+    def counts(self):
+        """Return the number of hashes per status."""
+        with self._lock:
+            return dict(self._conn.execute("SELECT status, COUNT(*) FROM transactions GROUP BY status"))
+
+    def iter_fetched(self, batch_size=10000):
+        """Yield the fetched transaction payloads in batches of at most batch_size."""
+        cursor = self._conn.execute("SELECT payload FROM transactions WHERE status = ? ORDER BY rowid", (FETCHED,))
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield [json.loads(row[0]) for row in rows]
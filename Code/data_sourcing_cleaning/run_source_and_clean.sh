@@ -6,21 +6,33 @@ chmod +x ./Code/data_sourcing_cleaning/run_source_and_clean.sh
 # Stop the script if any command fails
 set -e
 
+# Etherscan enrichment flag, from the environment or environment/run-config.env (defaults to 1)
+ETHERSCAN_ENRICHMENT=${ETHERSCAN_ENRICHMENT:-$(grep -E '^ETHERSCAN_ENRICHMENT' environment/run-config.env | cut -d '=' -f 2 | tr -d ' ')}
+ETHERSCAN_ENRICHMENT=${ETHERSCAN_ENRICHMENT:-1}
+
 # Run the Python scripts in the specified order
 echo "Running Uniswap API script..."
 python Code/data_sourcing_cleaning/uniswap/api_uniswap.py
 
-echo "Running Etherscan API script..."
-python Code/data_sourcing_cleaning/etherscan/api_etherscan.py
+if [ "$ETHERSCAN_ENRICHMENT" = "1" ]; then
+    echo "Running Etherscan API script..."
+    python Code/data_sourcing_cleaning/etherscan/api_etherscan.py
+else
+    echo "Skipping Etherscan API script (ETHERSCAN_ENRICHMENT=0)"
+fi
 
 echo "Running Binance download script..."
-python Code/data_sourcing_cleaning/binance/download-trade.py -t "spot" -s "ETHBTC" -skip-monthly 1
+python Code/data_sourcing_cleaning/binance/download-trade.py -t "spot" -s "ETHBTC" -plan 1
 
 echo "Running Uniswap cleaning script..."
 python Code/data_sourcing_cleaning/uniswap/uniswap-cleaning.py
 
-echo "Running Etherscan cleaning script..."
-python Code/data_sourcing_cleaning/etherscan/etherscan-cleaning.py
+if [ "$ETHERSCAN_ENRICHMENT" = "1" ]; then
+    echo "Running Etherscan cleaning script..."
+    python Code/data_sourcing_cleaning/etherscan/etherscan-cleaning.py
+else
+    echo "Skipping Etherscan cleaning script (ETHERSCAN_ENRICHMENT=0)"
+fi
 
 echo "Running Binance cleaning script..."
 python Code/data_sourcing_cleaning/binance/binance-cleaning.py
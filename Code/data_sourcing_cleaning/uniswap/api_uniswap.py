@@ -6,7 +6,8 @@ This script is designed for fetching data from Uniswap liquidity pools. It focus
 Key Functionalities:
 - Configuration Loading: Uses an environment file to load configuration settings, including the desired time span for data analysis.
 - Data Retrieval: Fetches data for each liquidity pool (LP) tier within the chosen time range, using the Uniswap APIs.
-- Data Storage: Saves the fetched data in a structured JSON format in a specified directory.
+- Data Storage: Saves the fetched data in a structured JSON format in a specified directory, or streams it to one
+  Parquet file per tier and transaction type when UNISWAP_OUTPUT is 'columnar' in the run config.
 - Transaction Analysis: Processes the data to format transactions, analyze swaps, mints, and burns, and identifies price extremes and transaction counts.
 
 Usage:
@@ -23,8 +24,12 @@ sys.path.append(os.getcwd())
 import time
 import math
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from tqdm import tqdm
 from dotenv import load_dotenv
-from uniswap_queries import lp_queries, uniswap_transaction_extract
+from uniswap_queries import lp_queries, uniswap_transaction_extract, uniswap_transaction_extract_keyset, pool_day_counts, iter_transaction_pages
+from uniswap_columnar import ColumnarPageWriter, columnar_path, COLUMNAR_DIRECTORY
 from environment.time_spans import load_run_config, time_spans
 
 # Select the desired time span for analysis
@@ -37,7 +42,13 @@ END = time_spans[selected_span]["end"]
 directory = "Data"
 file_path = os.path.join(directory, "WBTC-WETH.json")
 
-def fetch_tier_data(start_timestamp, end_timestamp, tiers):
+# Output format: 'json' (WBTC-WETH.json) or 'columnar' (one Parquet file per tier and type in COLUMNAR_DIRECTORY)
+UNISWAP_OUTPUT = os.getenv("UNISWAP_OUTPUT", "json").strip()
+
+# Pagination used against the subgraph: 'keyset' (timestamp/id cursors) or 'skip' (legacy first/skip)
+PAGINATION = 'keyset'
+
+def fetch_tier_data(start_timestamp, end_timestamp, tiers, pagination=PAGINATION):
     """
     Fetches data for each liquidity pool (LP) tier within the given time range.
 
@@ -45,6 +56,7 @@ def fetch_tier_data(start_timestamp, end_timestamp, tiers):
     start_timestamp (int): The start timestamp for data retrieval.
     end_timestamp (int): The end timestamp for data retrieval.
     tiers (dict): A dictionary to store data for different tiers.
+    pagination (str): 'keyset' for cursor based pages, 'skip' for the legacy first/skip pages.
 
     Returns:
     dict: A dictionary with updated data for each tier.
@@ -52,9 +64,235 @@ def fetch_tier_data(start_timestamp, end_timestamp, tiers):
     for tier in tiers:
         tiers[tier] = {}
         for lp_type, lp_query in lp_queries.items():
-            tiers[tier][lp_type] = uniswap_transaction_extract(lp_type, lp_query, start_timestamp, end_timestamp, tier)
+            if pagination == 'keyset':
+                tiers[tier][lp_type] = uniswap_transaction_extract_keyset(lp_type, start_timestamp, end_timestamp, tier)
+            else:
+                tiers[tier][lp_type] = uniswap_transaction_extract(lp_type, lp_query, start_timestamp, end_timestamp, tier)
     return tiers
 
+# Concurrent extraction: the (tier, type) crawls of fetch_tier_data run side by side, at most CRAWL_WORKERS at a time
+CONCURRENT = True
+CRAWL_WORKERS = 6
+
+def fetch_tier_data_concurrent(start_timestamp, end_timestamp, tiers, pagination=PAGINATION, max_workers=CRAWL_WORKERS):
+    """
+    Fetches data for each liquidity pool (LP) tier, running the crawls of every tier and type concurrently.
+
+    Each (tier, type) crawl is independent, so they are submitted to a thread pool capped at max_workers and the
+    total time is about that of the longest crawl. Every crawl reports its fetched transactions on its own
+    progress bar.
+
+    Args:
+    start_timestamp (int): The start timestamp for data retrieval.
+    end_timestamp (int): The end timestamp for data retrieval.
+    tiers (dict): A dictionary to store data for different tiers.
+    pagination (str): 'keyset' for cursor based pages, 'skip' for the legacy first/skip pages.
+    max_workers (int): Maximum number of crawls running at the same time.
+
+    Returns:
+    dict: A dictionary with updated data for each tier, in the same structure as fetch_tier_data.
+    """
+    crawls = [(tier, lp_type) for tier in tiers for lp_type in lp_queries]
+    progress = {crawl: tqdm(desc=f"Tier {crawl[0]} {crawl[1]}", unit="tx", position=position)
+                for position, crawl in enumerate(crawls)}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for tier, lp_type in crawls:
+            on_page = progress[(tier, lp_type)].update
+            if pagination == 'keyset':
+                futures[(tier, lp_type)] = executor.submit(uniswap_transaction_extract_keyset, lp_type, start_timestamp, end_timestamp, tier, on_page=on_page)
+            else:
+                futures[(tier, lp_type)] = executor.submit(uniswap_transaction_extract, lp_type, lp_queries[lp_type], start_timestamp, end_timestamp, tier, on_page=on_page)
+
+        for tier in tiers:
+            tiers[tier] = {}
+        for (tier, lp_type), future in futures.items():
+            tiers[tier][lp_type] = future.result()
+
+    for pbar in progress.values():
+        pbar.close()
+    return tiers
+
+# Sharded extraction: span is split into windows of roughly SHARD_TARGET_EVENTS events, fetched by SHARD_WORKERS threads
+SHARDED = True
+SHARD_WORKERS = 8
+SHARD_TARGET_EVENTS = 20000
+DAY = 86400
+
+def plan_windows(start_timestamp, end_timestamp, day_counts, target_events=SHARD_TARGET_EVENTS):
+    """
+    Splits [start, end) into contiguous windows holding roughly target_events each.
+
+    Quiet days are grouped together, busy days are split into equal sub-windows. Partial days at the edges
+    of the span are weighted by the fraction of the day they cover. Days without a count are treated as
+    one full window each when no counts are available at all.
+
+    Args:
+    start_timestamp (int): The start timestamp of the span.
+    end_timestamp (int): The end timestamp of the span.
+    day_counts (dict): Day start timestamp -> estimated number of events.
+    target_events (int): Desired number of events per window.
+
+    Returns:
+    list: (window_start, window_end) tuples covering the span in order.
+    """
+    default_count = 0 if day_counts else target_events
+    windows = []
+    window_start, events = start_timestamp, 0
+    for day in range(start_timestamp - start_timestamp % DAY, end_timestamp, DAY):
+        lo, hi = max(day, start_timestamp), min(day + DAY, end_timestamp)
+        estimate = day_counts.get(day, default_count) * (hi - lo) / DAY
+        if estimate > target_events:
+            if window_start < lo:
+                windows.append((window_start, lo))
+            parts = math.ceil(estimate / target_events)
+            edges = [lo + (hi - lo) * i // parts for i in range(parts + 1)]
+            windows.extend(zip(edges[:-1], edges[1:]))
+            window_start, events = hi, 0
+        else:
+            events += estimate
+            if events >= target_events:
+                windows.append((window_start, hi))
+                window_start, events = hi, 0
+    if window_start < end_timestamp:
+        windows.append((window_start, end_timestamp))
+    return windows
+
+def merge_windows(window_results):
+    """Merges transactions fetched per window: de-duplicates by id and orders by descending timestamp, then id."""
+    merged = {}
+    for transactions in window_results:
+        for transaction in transactions:
+            merged[transaction['id']] = transaction
+    return sorted(merged.values(), key=lambda tx: (-int(tx['timestamp']), tx['id']))
+
+def plan_tier_windows(start_timestamp, end_timestamp, tier, target_events=SHARD_TARGET_EVENTS):
+    """Probes the daily transaction counts of a tier and plans its windows with plan_windows."""
+    try:
+        day_counts = pool_day_counts(start_timestamp, end_timestamp, tier)
+    except Exception as e:
+        print(f"Density probe failed for tier {tier}, falling back to daily windows:", e)
+        day_counts = {}
+    windows = plan_windows(start_timestamp, end_timestamp, day_counts, target_events)
+    print(f"Tier {tier}: {len(windows)} windows")
+    return windows
+
+def fetch_tier_data_sharded(start_timestamp, end_timestamp, tiers, max_workers=SHARD_WORKERS, target_events=SHARD_TARGET_EVENTS):
+    """
+    Fetches data for each liquidity pool (LP) tier by splitting the span into density sized windows.
+
+    The event density of each tier is probed from the pool's daily transaction counts, the span is cut into
+    windows of roughly equal event counts (see plan_windows), and every (tier, type, window) crawl is fetched
+    concurrently with a bounded thread pool. Results are merged deterministically with merge_windows.
+
+    Args:
+    start_timestamp (int): The start timestamp for data retrieval.
+    end_timestamp (int): The end timestamp for data retrieval.
+    tiers (dict): A dictionary to store data for different tiers.
+    max_workers (int): Maximum number of concurrent requests.
+    target_events (int): Desired number of events per window.
+
+    Returns:
+    dict: A dictionary with updated data for each tier, in the same structure as fetch_tier_data.
+    """
+    tasks = {}
+    for tier in tiers:
+        windows = plan_tier_windows(start_timestamp, end_timestamp, tier, target_events)
+        for lp_type in lp_queries:
+            tasks[(tier, lp_type)] = windows
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {key: [executor.submit(uniswap_transaction_extract_keyset, key[1], window_start, window_end, key[0])
+                         for window_start, window_end in windows]
+                   for key, windows in tasks.items()}
+
+        for tier in tiers:
+            tiers[tier] = {}
+        for (tier, lp_type), window_futures in futures.items():
+            tiers[tier][lp_type] = merge_windows(future.result() for future in window_futures)
+    return tiers
+
+
+def stream_tier_data_columnar(start_timestamp, end_timestamp, tiers, max_workers=None, out_directory=COLUMNAR_DIRECTORY,
+                              sharded=SHARDED, target_events=SHARD_TARGET_EVENTS):
+    """
+    Fetches data for each liquidity pool (LP) tier and streams every page to Parquet as it arrives.
+
+    Crawls run concurrently as in fetch_tier_data_concurrent, but pages are decoded into typed column buffers
+    and flushed as row groups (see ColumnarPageWriter) instead of being kept in memory until the end.
+
+    When sharded, the span of every tier is cut into density sized windows as in fetch_tier_data_sharded and every
+    (tier, type, window) crawl runs concurrently. A finished window is merged with merge_windows and written as soon
+    as every newer window of its tier and type is written, so the files hold the same rows, in the same order, as the
+    sharded JSON extract, and only the windows finished out of order are kept in memory.
+
+    Args:
+    start_timestamp (int): The start timestamp for data retrieval.
+    end_timestamp (int): The end timestamp for data retrieval.
+    tiers (dict): The tiers to fetch.
+    max_workers (int): Maximum number of crawls running at the same time, SHARD_WORKERS when sharded and
+        CRAWL_WORKERS otherwise by default.
+    out_directory (str): Directory receiving the Parquet files.
+    sharded (bool): Whether to split the span of every tier into density sized windows.
+    target_events (int): Desired number of events per window when sharded.
+
+    Returns:
+    dict: The number of transactions written, by tier and type.
+    """
+    if sharded:
+        return stream_tier_windows_columnar(start_timestamp, end_timestamp, tiers, max_workers or SHARD_WORKERS, out_directory, target_events)
+
+    crawls = [(tier, lp_type) for tier in tiers for lp_type in lp_queries]
+
+    def crawl(tier, lp_type, position):
+        with ColumnarPageWriter(lp_type, columnar_path(tier, lp_type, out_directory)) as writer, \
+                tqdm(desc=f"Tier {tier} {lp_type}", unit="tx", position=position) as pbar:
+            for page in iter_transaction_pages(lp_type, start_timestamp, end_timestamp, tier):
+                writer.write_page(page)
+                pbar.update(len(page))
+        return writer.rows
+
+    with ThreadPoolExecutor(max_workers=max_workers or CRAWL_WORKERS) as executor:
+        futures = {(tier, lp_type): executor.submit(crawl, tier, lp_type, position) for position, (tier, lp_type) in enumerate(crawls)}
+        counts = {tier: {} for tier in tiers}
+        for (tier, lp_type), future in futures.items():
+            counts[tier][lp_type] = future.result()
+    return counts
+
+def stream_tier_windows_columnar(start_timestamp, end_timestamp, tiers, max_workers, out_directory, target_events):
+    """Sharded crawls of stream_tier_data_columnar."""
+    windows = {tier: plan_tier_windows(start_timestamp, end_timestamp, tier, target_events) for tier in tiers}
+    crawls = [(tier, lp_type) for tier in tiers for lp_type in lp_queries]
+    writers = {crawl: ColumnarPageWriter(crawl[1], columnar_path(*crawl, out_directory)) for crawl in crawls}
+    progress = {crawl: tqdm(desc=f"Tier {crawl[0]} {crawl[1]}", unit="tx", position=position)
+                for position, crawl in enumerate(crawls)}
+    locks = {crawl: threading.Lock() for crawl in crawls}
+    # Windows are written newest first: the next window to write and the finished windows waiting for it
+    next_window = {crawl: len(windows[crawl[0]]) - 1 for crawl in crawls}
+    finished = {crawl: {} for crawl in crawls}
+
+    def crawl_window(tier, lp_type, index):
+        window_start, window_end = windows[tier][index]
+        transactions = merge_windows([uniswap_transaction_extract_keyset(lp_type, window_start, window_end, tier,
+                                                                         on_page=progress[(tier, lp_type)].update)])
+        with locks[(tier, lp_type)]:
+            finished[(tier, lp_type)][index] = transactions
+            while next_window[(tier, lp_type)] in finished[(tier, lp_type)]:
+                writers[(tier, lp_type)].write_page(finished[(tier, lp_type)].pop(next_window[(tier, lp_type)]))
+                next_window[(tier, lp_type)] -= 1
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(crawl_window, tier, lp_type, index)
+                       for tier, lp_type in crawls for index in range(len(windows[tier]))]
+            for future in futures:
+                future.result()
+    finally:
+        for crawl in crawls:
+            writers[crawl].close()
+            progress[crawl].close()
+    return {tier: {lp_type: writers[(tier, lp_type)].rows for lp_type in lp_queries} for tier in tiers}
 
 #===================================================================================================#
 # Below some basic analysis to validate against https://www.geckoterminal.com/eth/pools/0xcbcdf9626bc03e24f779434178a73a0b4bad62ed
@@ -125,15 +363,25 @@ if __name__ == "__main__":
     # Initialize tiers for different liquidity pools
     tiers = {500: None, 3000: None}
 
-    # Fetch data for each tier
-    tiers = fetch_tier_data(START, END, tiers)
+    if UNISWAP_OUTPUT == 'columnar':
+        # Stream each tier and type to its own Parquet file, sharded into density sized windows when SHARDED
+        counts = stream_tier_data_columnar(START, END, tiers, sharded=SHARDED)
+        print("Transactions written:", counts)
+    else:
+        # Fetch data for each tier
+        if SHARDED:
+            tiers = fetch_tier_data_sharded(START, END, tiers)
+        elif CONCURRENT:
+            tiers = fetch_tier_data_concurrent(START, END, tiers)
+        else:
+            tiers = fetch_tier_data(START, END, tiers)
 
-    # Check if the directory exists, if not, create it
-    if not os.path.exists(directory):
-        os.makedirs(directory)
+        # Check if the directory exists, if not, create it
+        if not os.path.exists(directory):
+            os.makedirs(directory)
 
-    # Save the collected tier data to a JSON file
-    with open(file_path, "w") as file:
-        json.dump(tiers, file)
+        # Save the collected tier data to a JSON file
+        with open(file_path, "w") as file:
+            json.dump(tiers, file)
 
     # run_basic_analysis()
\ No newline at end of file
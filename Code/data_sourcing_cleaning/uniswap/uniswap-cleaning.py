@@ -1,6 +1,16 @@
 import os
-import json
+import sys
 import pandas as pd
+from dotenv import load_dotenv
+
+sys.path.append(os.getcwd())
+
+from uniswap_columnar import read_columnar
+from uniswap_json_stream import read_json_table
+from environment.storage import write_dataset
+
+load_dotenv('environment/run-config.env')
+UNISWAP_OUTPUT = os.getenv("UNISWAP_OUTPUT", "json").strip()
 
 # Directory path
 out_directory = 'Data/cleansed'
@@ -9,41 +19,23 @@ out_directory = 'Data/cleansed'
 if not os.path.exists(out_directory):
     os.makedirs(out_directory)
 
-filepath = "Data/WBTC-WETH.json"
-
-# Open the JSON file
-with open(filepath) as json_file:
-    # Load the data into a Python dictionary
-    data = json.load(json_file)
-
 # List of transaction types
 transaction_types = ['swaps', 'mints', 'burns']
 
-# Initialize an empty DataFrame
-all_transactions_df = pd.DataFrame()
-
-# Iterate over each transaction type
-for transaction_type in transaction_types:
-    # Initialize an empty list to store the transactions of this type
-    transaction_data = []
-
-    # Iterate over each pool
-    for pool, pool_data in data.items():
-        # Check if this type of transaction exists for this pool
-        if transaction_type in pool_data:
-            for transaction in pool_data[transaction_type]:
-                # Add the pool information to the transaction data
-                transaction['pool'] = pool
-            # Extend the transaction data list
-            transaction_data.extend(pool_data[transaction_type])
-
-    # Create a DataFrame from the list
-    transaction_df = pd.json_normalize(transaction_data)
-    # Add the transaction type as a new column
-    transaction_df['transaction_type'] = transaction_type
-    
-    # Append this DataFrame to the combined DataFrame
-    all_transactions_df = pd.concat([all_transactions_df, transaction_df], ignore_index=True)
-
-# Save the DataFrame to a CSV file
-all_transactions_df.to_csv(f'{out_directory}/uniswap.csv', index=False)
+if UNISWAP_OUTPUT == 'columnar':
+    # The Parquet files are already flat and typed, only the pool and the transaction type are added
+    transaction_dfs = []
+    for transaction_type in transaction_types:
+        for pool, transaction_df in read_columnar(transaction_type).items():
+            transaction_df['pool'] = pool
+            transaction_df['transaction_type'] = transaction_type
+            transaction_dfs.append(transaction_df)
+    all_transactions_df = pd.concat(transaction_dfs, ignore_index=True)
+    all_transactions_df['pool'] = all_transactions_df['pool'].astype('category')
+    all_transactions_df['transaction_type'] = all_transactions_df['transaction_type'].astype('category')
+else:
+    # Stream the JSON extract into typed columns instead of loading and normalizing it whole
+    all_transactions_df = read_json_table("Data/WBTC-WETH.json")
+
+# Save the DataFrame as the cleansed uniswap dataset
+write_dataset(all_transactions_df, 'uniswap')
@@ -0,0 +1,143 @@
+"""
+Columnar Uniswap Output
+
+Decodes subgraph pages straight into typed column buffers and flushes them as row groups of one Parquet file
+per tier and transaction type, so a crawl only ever holds `flush_rows` decoded transactions in memory however
+long the span is.
+
+Columns keep the names pd.json_normalize gives the JSON extract ('transaction.id', 'transaction.blockNumber'),
+with timestamps and block numbers as int64, amounts as float64 and ticks as int32.
+"""
+
+import os
+import glob
+import array
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+COLUMNAR_DIRECTORY = "Data/WBTC-WETH"
+
+# Column name -> (array typecode, arrow type); typecode None marks string columns kept in a list
+column_types = {
+    'id': (None, pa.string()),
+    'timestamp': ('q', pa.int64()),
+    'amount': ('d', pa.float64()),
+    'amount0': ('d', pa.float64()),
+    'amount1': ('d', pa.float64()),
+    'amountUSD': ('d', pa.float64()),
+    'tickLower': ('i', pa.int32()),
+    'tickUpper': ('i', pa.int32()),
+    'transaction.id': (None, pa.string()),
+    'transaction.blockNumber': ('q', pa.int64()),
+}
+
+lp_columns = {
+    'swaps': ['id', 'timestamp', 'amount0', 'amount1', 'amountUSD', 'transaction.id', 'transaction.blockNumber'],
+    'mints': ['id', 'timestamp', 'amount', 'amount0', 'amount1', 'amountUSD', 'tickLower', 'tickUpper',
+              'transaction.id', 'transaction.blockNumber'],
+    'burns': ['id', 'timestamp', 'amount', 'amount0', 'amount1', 'amountUSD', 'tickLower', 'tickUpper',
+              'transaction.id', 'transaction.blockNumber'],
+}
+
+
+def columnar_path(tier, lp_type, directory=COLUMNAR_DIRECTORY):
+    """Path of the Parquet file holding one transaction type of one tier."""
+    return os.path.join(directory, f"{tier}_{lp_type}.parquet")
+
+
+def lp_schema(lp_type):
+    return pa.schema([(column, column_types[column][1]) for column in lp_columns[lp_type]])
+
+
+class ColumnarPageWriter:
+    """
+    Appends subgraph pages of one transaction type to a Parquet file.
+
+    Args:
+        lp_type (str): Transaction type, one of the keys of lp_columns.
+        path (str): Output Parquet file, overwritten.
+        flush_rows (int): Number of buffered transactions that triggers a row group flush.
+    """
+
+    def __init__(self, lp_type, path, flush_rows=100000):
+        self.columns = lp_columns[lp_type]
+        self.schema = lp_schema(lp_type)
+        self.path = path
+        self.flush_rows = flush_rows
+        self.rows = 0
+        self._writer = None
+        self._reset()
+
+    def _reset(self):
+        self._buffers = {column: [] if column_types[column][0] is None else array.array(column_types[column][0])
+                         for column in self.columns}
+        self._buffered = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write_page(self, page):
+        """Decode a page of transactions into the column buffers, flushing when they are full."""
+        buffers = self._buffers
+        for transaction in page:
+            nested = transaction['transaction']
+            for column, buffer in buffers.items():
+                if column == 'transaction.id':
+                    buffer.append(nested['id'])
+                elif column == 'transaction.blockNumber':
+                    buffer.append(int(nested['blockNumber']))
+                elif column_types[column][0] == 'd':
+                    buffer.append(float(transaction[column]))
+                elif column_types[column][0] is None:
+                    buffer.append(transaction[column])
+                else:
+                    buffer.append(int(transaction[column]))
+        self._buffered += len(page)
+        if self._buffered >= self.flush_rows:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered transactions as one row group."""
+        if self._writer is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._writer = pq.ParquetWriter(self.path, self.schema)
+        if not self._buffered:
+            return
+        arrays = []
+        for column in self.columns:
+            buffer = self._buffers[column]
+            if column_types[column][0] is not None:
+                buffer = np.frombuffer(buffer, dtype=buffer.typecode)
+            arrays.append(pa.array(buffer, type=self.schema.field(column).type))
+        self._writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+        self.rows += self._buffered
+        self._reset()
+
+    def close(self):
+        """Flush the remaining transactions and close the file. A crawl without transactions leaves an empty file."""
+        self.flush()
+        self._writer.close()
+
+
+def read_columnar(lp_type, columns=None, directory=COLUMNAR_DIRECTORY):
+    """
+    Read one transaction type of every tier.
+
+    Args:
+        lp_type (str): Transaction type.
+        columns (list): Optional subset of columns to read.
+        directory (str): Directory holding the Parquet files.
+
+    Returns:
+        Dict[str, pd.DataFrame]: DataFrames by tier, in tier order.
+    """
+    frames = {}
+    for path in sorted(glob.glob(os.path.join(directory, f"*_{lp_type}.parquet")), key=lambda p: int(os.path.basename(p).split('_')[0])):
+        tier = os.path.basename(path).split('_')[0]
+        frames[tier] = pd.read_parquet(path, columns=columns)
+    return frames
@@ -0,0 +1,213 @@
+"""
+Streaming Uniswap JSON Reader
+
+Reads the JSON extract (Data/WBTC-WETH.json, laid out as {tier: {type: [transaction, ...]}}) incrementally:
+the file is read in fixed size chunks and json.JSONDecoder.raw_decode decodes one transaction at a time, straight
+into typed column buffers. Only the buffers and one chunk are held in memory, so the peak stays close to the size
+of the final table instead of several times the raw JSON.
+
+Columns are typed as in uniswap_columnar (int64 timestamps and block numbers, float64 amounts, int32 ticks), with
+pool and transaction_type as categoricals. Columns a transaction type does not have (the ticks of swaps) are
+missing for its rows, as with pd.json_normalize.
+"""
+
+import json
+import array
+import numpy as np
+import pandas as pd
+from uniswap_columnar import column_types, lp_columns
+
+LP_TYPES = ['swaps', 'mints', 'burns']
+
+WHITESPACE = ' \t\n\r'
+
+
+class JsonCursor:
+    """
+    Cursor over a JSON file read in chunks, decoding one value at a time.
+
+    Args:
+        file: File opened in text mode.
+        chunk_size (int): Number of characters read at once.
+    """
+
+    def __init__(self, file, chunk_size):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        """Read the next chunk, dropping what has already been decoded. Returns False at the end of the file."""
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Skip whitespace and return the next character, '' at the end of the file."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, chars):
+        """Consume the next character, which must be one of chars, and return it."""
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(f"Expected one of {chars!r} in the JSON file, found {char!r}")
+        self.pos += 1
+        return char
+
+    def value(self):
+        """Decode the next JSON value, reading more chunks while it is incomplete."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # A value ending at the end of the buffer may be a truncated number
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+    def null(self):
+        """Consume a null value and return True, or return False if the next value is not null."""
+        if self.peek() != 'n':
+            return False
+        self.value()
+        return True
+
+    def keys(self):
+        """Iterate over the keys of an object; the caller consumes each member's value before the next key."""
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            if self.expect(',}') == '}':
+                return
+
+    def items(self):
+        """Iterate over the decoded elements of an array."""
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.expect(',]') == ']':
+                return
+
+
+def iter_transaction_lists(path, chunk_size=1 << 20):
+    """
+    Walk the JSON extract, yielding each tier and transaction type with an iterator over its transactions.
+
+    The transactions must be consumed before moving to the next pair. Tiers or types stored as null are skipped.
+    """
+    with open(path, 'r') as file:
+        cursor = JsonCursor(file, chunk_size)
+        for pool in cursor.keys():
+            if cursor.null():
+                continue
+            for lp_type in cursor.keys():
+                if cursor.null():
+                    continue
+                yield pool, lp_type, cursor.items()
+
+
+def output_columns():
+    """Column order of the cleansed table, the same as the json_normalize frames concatenated by type."""
+    columns = []
+    for lp_type in LP_TYPES:
+        fields = lp_columns[lp_type]
+        for column in [c for c in fields if '.' not in c] + ['pool'] + [c for c in fields if '.' in c] + ['transaction_type']:
+            if column not in columns:
+                columns.append(column)
+    return columns
+
+
+def read_json_table(path, chunk_size=1 << 20):
+    """
+    Read the JSON extract into one typed DataFrame, ordered by transaction type and then tier.
+
+    Args:
+        path (str): Path of the JSON extract.
+        chunk_size (int): Number of characters read at once.
+
+    Returns:
+        pd.DataFrame: One row per transaction, with pool and transaction_type as categoricals.
+    """
+    buffers = {lp_type: {column: [] if column_types[column][0] is None else array.array(column_types[column][0])
+                         for column in lp_columns[lp_type]} for lp_type in LP_TYPES}
+    pool_codes = {lp_type: array.array('h') for lp_type in LP_TYPES}
+    pools = []
+
+    for pool, lp_type, transactions in iter_transaction_lists(path, chunk_size):
+        if pool not in pools:
+            pools.append(pool)
+        code = pools.index(pool)
+        # (append, field, nested, converter) for each column, resolved once per list
+        decoders = []
+        for column, buffer in buffers[lp_type].items():
+            typecode = column_types[column][0]
+            convert = str if typecode is None else float if typecode == 'd' else int
+            decoders.append((buffer.append, column.split('.')[-1], '.' in column, convert))
+        codes = pool_codes[lp_type]
+        for transaction in transactions:
+            nested = transaction['transaction']
+            for append, field, is_nested, convert in decoders:
+                append(convert(nested[field] if is_nested else transaction[field]))
+            codes.append(code)
+
+    lengths = [len(pool_codes[lp_type]) for lp_type in LP_TYPES]
+    data = {}
+    for column in output_columns():
+        if column == 'pool':
+            codes = np.concatenate([np.frombuffer(pool_codes[lp_type], dtype='h') for lp_type in LP_TYPES])
+            data[column] = pd.Categorical.from_codes(codes, categories=pools)
+        elif column == 'transaction_type':
+            data[column] = pd.Categorical.from_codes(np.repeat(np.arange(len(LP_TYPES)), lengths), categories=LP_TYPES)
+        else:
+            data[column] = assemble_column(column, [buffers[lp_type].pop(column, None) for lp_type in LP_TYPES], lengths)
+    return pd.DataFrame(data)
+
+
+def assemble_column(column, parts, lengths):
+    """
+    Concatenate the buffers of one column across transaction types, releasing them as they are copied.
+
+    A part is None for types without the column: strings are then None, floats NaN and integers masked.
+    """
+    typecode = column_types[column][0]
+    if typecode is None:
+        values = np.empty(sum(lengths), dtype=object)
+        start = 0
+        for part, length in zip(parts, lengths):
+            values[start:start + length] = part if part is not None else None
+            start += length
+        return values
+    dtype = np.dtype(typecode)
+    filled = [np.frombuffer(part, dtype=dtype) if part is not None
+              else np.full(length, np.nan if typecode == 'd' else 0, dtype=dtype) for part, length in zip(parts, lengths)]
+    values = np.concatenate(filled)
+    if typecode == 'd' or all(part is not None for part in parts):
+        return values
+    mask = np.concatenate([np.zeros(length, dtype=bool) if part is not None else np.ones(length, dtype=bool)
+                           for part, length in zip(parts, lengths)])
+    return pd.arrays.IntegerArray(values, mask)
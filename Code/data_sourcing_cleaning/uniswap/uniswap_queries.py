@@ -1,33 +1,22 @@
 import requests
 import json
 
-lp_queries = {'swaps': """
-        swaps(
-        where: {
-            timestamp_gte: $start,   # Unix timestamp for January 1, 2022, 00:00:00
-            timestamp_lt: $end     # Unix timestamp for June 30, 2022, 23:59:59   TESTING ON 5JAN 1641312000
-        },
-        orderBy: timestamp, orderDirection: desc,
-        first: $first,
-        skip: $skip
-        ) {
+# Define the API endpoint
+UNISWAP_URL = "https://api.thegraph.com/subgraphs/name/uniswap/uniswap-v3"
+
+# Fields fetched for each transaction type
+lp_fields = {'swaps': """
             id
             timestamp
             amount0
             amount1
-            amountUSD             
-        }
-    """,
+            amountUSD
+            transaction {
+                id
+                blockNumber
+            }""",
 
-    'mints':"""
-        mints(where: {
-            timestamp_gte: $start,
-            timestamp_lt: $end
-        },
-        orderBy: timestamp, orderDirection: desc,
-        first: $first,
-        skip: $skip
-        ) {
+    'mints': """
             id
             timestamp
             amount
@@ -36,18 +25,12 @@ lp_queries = {'swaps': """
             amountUSD
             tickLower
             tickUpper
-        }
-    """,
+            transaction {
+                id
+                blockNumber
+            }""",
 
-    'burns':"""
-        burns(where: {
-            timestamp_gte: $start,
-            timestamp_lt: $end
-        },
-        orderBy: timestamp, orderDirection: desc,
-        first: $first,
-        skip: $skip
-        ) {
+    'burns': """
             id
             timestamp
             amount
@@ -56,23 +39,183 @@ lp_queries = {'swaps': """
             amountUSD
             tickLower
             tickUpper
-        }
-    """
+            transaction {
+                id
+                blockNumber
+            }"""
 }
 
-def uniswap_transaction_extract(lp_type, lp_query, start, end, tier):
-    # Define the API endpoint
-    url = "https://api.thegraph.com/subgraphs/name/uniswap/uniswap-v3"
+def build_lp_query(lp_type, where, order_by, order_direction, paging):
+    """Builds the nested pool query for a transaction type with the given filter and paging arguments."""
+    return f"""
+        {lp_type}(where: {{
+            {where}
+        }},
+        orderBy: {order_by}, orderDirection: {order_direction},
+        {paging}
+        ) {{{lp_fields[lp_type]}
+        }}
+    """
 
-    # Define the GraphQL query
-    query = """
-    query ($first: Int!, $skip: Int!, $start: Int!, $end: Int!, $feeTier: Int!) {
+def build_pool_query(variables, lp_query):
+    """Wraps a transaction query in the WBTC-WETH pool selection for a fee tier."""
+    return """
+    query (""" + variables + """, $feeTier: Int!) {
         pools(where: {
         feeTier: $feeTier,
         token0: "0x2260fac5e5542a773aa44fbcfedf7c193bc2c599",
         token1: "0xc02aaa39b223fe8d0a0e5c4f27ead9083c756cc2"
     }) {""" + lp_query + "}}"
 
+# Offset based queries (first/skip), used by uniswap_transaction_extract
+lp_queries = {lp_type: build_lp_query(lp_type,
+                                      "timestamp_gte: $start,\n            timestamp_lt: $end",
+                                      "timestamp", "desc",
+                                      "first: $first,\n        skip: $skip")
+              for lp_type in lp_fields}
+
+# Keyset based queries, used by iter_transaction_pages
+# - range: walks backwards in time below the `before` cursor
+# - ties: drains every transaction sharing one timestamp, ordered by id
+keyset_queries = {lp_type: {
+    'range': build_pool_query("$first: Int!, $start: Int!, $before: Int!",
+                              build_lp_query(lp_type,
+                                             "timestamp_gte: $start,\n            timestamp_lt: $before",
+                                             "timestamp", "desc",
+                                             "first: $first")),
+    'ties': build_pool_query("$first: Int!, $timestamp: Int!, $after: ID!",
+                             build_lp_query(lp_type,
+                                            "timestamp: $timestamp,\n            id_gt: $after",
+                                            "id", "asc",
+                                            "first: $first"))}
+    for lp_type in lp_fields}
+
+def post_query(query, variables, url=UNISWAP_URL):
+    """
+    Sends a GraphQL query and returns its data payload.
+
+    Raises:
+        Exception: If the request fails or the subgraph returns errors.
+    """
+    response = requests.post(url, json={"query": query, "variables": variables})
+    if response.status_code != 200:
+        raise Exception("Request failed with status code:", response.status_code)
+
+    data = json.loads(response.text)
+    if "errors" in data:
+        raise Exception("Query returned errors:", data["errors"])
+    return data["data"]
+
+def iter_transaction_pages(lp_type, start, end, tier, first=1000, url=UNISWAP_URL):
+    """
+    Yields pages of transactions between start (inclusive) and end (exclusive) using keyset pagination.
+
+    Pages walk backwards in time with a `timestamp_lt` cursor, so every request costs the same no matter how
+    deep into the span it is. When a page comes back full, the transactions sharing its oldest timestamp may
+    continue on the next page: those are dropped from the page and drained with an `id_gt` cursor on that exact
+    timestamp before the time cursor moves past it. No transaction is skipped at a page boundary, and any
+    transaction already yielded for the current timestamp is filtered out.
+
+    Args:
+    lp_type (str): Transaction type, one of the keys of lp_fields.
+    start (int): The start timestamp for data retrieval.
+    end (int): The end timestamp for data retrieval.
+    tier (int): The fee tier of the pool.
+    first (int): Number of transactions per request.
+    url (str): GraphQL endpoint, can point to a local stand-in.
+
+    Yields:
+    list: Transactions ordered by descending timestamp.
+    """
+    range_query = keyset_queries[lp_type]['range']
+    ties_query = keyset_queries[lp_type]['ties']
+
+    # Ids already yielded for the most recent timestamp
+    seen_timestamp, seen_ids = None, set()
+
+    def dedupe(transactions):
+        nonlocal seen_timestamp, seen_ids
+        page = []
+        for transaction in transactions:
+            timestamp = int(transaction['timestamp'])
+            if timestamp != seen_timestamp:
+                seen_timestamp, seen_ids = timestamp, set()
+            if transaction['id'] not in seen_ids:
+                seen_ids.add(transaction['id'])
+                page.append(transaction)
+        return page
+
+    before = end
+    while True:
+        variables = {"first": first, "start": start, "before": before, "feeTier": tier}
+        transactions = post_query(range_query, variables, url)["pools"][0][lp_type]
+
+        # If the number of fetched transactions is less than 'first', we have reached the end of the data
+        if len(transactions) < first:
+            page = dedupe(transactions)
+            if page:
+                yield page
+            break
+
+        boundary = int(transactions[-1]['timestamp'])
+        page = dedupe([tx for tx in transactions if int(tx['timestamp']) > boundary])
+        if page:
+            yield page
+
+        # Drain the boundary timestamp by id, then move the time cursor past it
+        after = ""
+        while True:
+            variables = {"first": first, "timestamp": boundary, "after": after, "feeTier": tier}
+            ties = post_query(ties_query, variables, url)["pools"][0][lp_type]
+            page = dedupe(ties)
+            if page:
+                yield page
+            if len(ties) < first:
+                break
+            after = ties[-1]['id']
+
+        before = boundary
+
+def uniswap_transaction_extract_keyset(lp_type, start, end, tier, url=UNISWAP_URL, on_page=None):
+    """
+    Fetches all transactions of a type for a fee tier using keyset pagination, see iter_transaction_pages.
+
+    on_page, if given, is called with the number of transactions of each page, e.g. to update a progress bar.
+    """
+    all_transactions = []
+    for page in iter_transaction_pages(lp_type, start, end, tier, url=url):
+        all_transactions.extend(page)
+        if on_page:
+            on_page(len(page))
+    return all_transactions
+
+def pool_day_counts(start, end, tier, url=UNISWAP_URL):
+    """
+    Cheap density probe: returns the daily transaction count of the pool for each day touching [start, end).
+
+    Returns:
+        dict: Day start timestamp -> number of transactions (swaps, mints, burns and collects) on that day.
+    """
+    query = build_pool_query("$start: Int!, $end: Int!", """
+        poolDayData(where: {
+            date_gte: $start,
+            date_lt: $end
+        },
+        orderBy: date, orderDirection: asc,
+        first: 1000
+        ) {
+            date
+            txCount
+        }
+    """)
+    variables = {"start": start - start % 86400, "end": end, "feeTier": tier}
+    day_data = post_query(query, variables, url)["pools"][0]["poolDayData"]
+    return {int(day["date"]): int(day["txCount"]) for day in day_data}
+
+def uniswap_transaction_extract(lp_type, lp_query, start, end, tier, url=UNISWAP_URL, on_page=None):
+    # Define the GraphQL query
+    query = build_pool_query("$first: Int!, $skip: Int!, $start: Int!, $end: Int!", lp_query)
+
    # Set the initial variables
     first = 1000  # Number of transactions per batch
     skip = 0  # Initial value for skipping
@@ -92,6 +235,8 @@ def uniswap_transaction_extract(lp_type, lp_query, start, end, tier):
             # Extract the transactions from the response
             transactions = data["data"]["pools"][0][lp_type]
             all_transactions.extend(transactions)
+            if on_page:
+                on_page(len(transactions))
 
             # If the number of fetched transactions is less than 'first', we have reached the end of the data
             if len(transactions) < first:
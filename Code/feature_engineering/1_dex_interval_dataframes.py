@@ -4,11 +4,11 @@ This script performs cleaning, preprocessing, merging, and analysis operations o
 The provided code performs data processing and interval analysis on Uniswap and Etherscan. Here is a summary of the main functionalities:
 
 1. Clean Uniswap Data: The code reads and cleans the Uniswap data, removing any additional information after the '#' symbol in the 'id' column.
-2. Clean Etherscan Data: The code reads and cleans the Etherscan data.
+2. Clean Etherscan Data: The code reads and cleans the Etherscan data. When ETHERSCAN_ENRICHMENT is 0 in run-config.env, the transaction hash and block number fetched from the subgraph are used instead.
 3. Preprocess Data: The code preprocesses the merged DEX (Decentralized Exchange) data by converting timestamps to datetime format, sorting the data, converting hexadecimal block numbers to integers, and creating additional columns for analysis.
 4. Clean Mint Transactions: The code reduces mint transactions on the same block, optimizing the dataset for interval analysis.
 5. Infer Block Intervals: The code infers block intervals and creates interval-based dataframes. It calculates intervals based on the 'pool' column and specified shift periods. It also calculates additional intervals for the 'other' pool.
-6. Save Interim Results: The code saves the intermediate results, including the reduced DEX data, block data, and interval dataframes, to separate CSV files and a pickle file.
+6. Save Interim Results: The code saves the intermediate results, including the reduced DEX data, block data, the translation of the former crc32 hashids, and the row offsets of the interval dataframes, as datasets (CSV or Parquet, see environment/storage.py), and the reduced DEX data as a memory-mapped event store (see utils/event_store.py).
 7. Log Count of Transaction Types: The code logs the count of transaction types, providing insights into the distribution of transactions across pools and types.
 
 The main function orchestrates these functionalities and is the entry point of the program.
@@ -16,17 +16,27 @@ The main function orchestrates these functionalities and is the entry point of t
 """
 
 import os
-import pickle
+import sys
 import pandas as pd
 import numpy as np
 from collections import Counter
-from utils.build_intervals import calculate_intervals, calculate_other_intervals, create_interval_dataframes, reduce_mints
+from dotenv import load_dotenv
+
+sys.path.append(os.getcwd())
+
+from environment.hex_columns import decode_hex
+from environment.storage import read_dataset, write_dataset
+from utils.build_intervals import calculate_intervals, calculate_other_intervals, create_interval_dataframes, hashid_translation, reduce_mints
+from utils.event_store import EventStore, EVENT_STORE_PATH
 
 # Constants
 SHIFT_PERIODS = range(0, 4) # Define shift periods for the intervals
-CLEANSED_FILEPATH = "Data/cleansed"
 RESULTS_DIR = "Data/interim_results"
 
+# Use Etherscan data for the transaction hash and block number, or the subgraph fields when disabled
+load_dotenv('environment/run-config.env')
+ETHERSCAN_ENRICHMENT = os.getenv("ETHERSCAN_ENRICHMENT", "1").strip() == "1"
+
 
 def validate_block_number_order(df):
     df_sorted_timestamp = df.sort_values(by='timestamp')
@@ -34,16 +44,13 @@ def validate_block_number_order(df):
     block_number_order_same = (df_sorted_timestamp['blockNumber'].values == df_sorted_blocknumber['blockNumber'].values).all()
     assert block_number_order_same, "Sorting by timestamp and block number does not result in the same block number order"
 
-def clean_uniswap_data(uniswap_filepath):
+def clean_uniswap_data():
     """Loads and cleans Uniswap data.
 
-    Args:
-        filepath (str): Path to the Uniswap data file.
-
     Returns:
         pd.DataFrame: Cleaned Uniswap data.
     """
-    df_uniswap = pd.read_csv(uniswap_filepath)
+    df_uniswap = read_dataset('uniswap')
     df_uniswap['id'] = df_uniswap['id'].str.split('#').str[0]
 
     #TODO -> Check why we have duplicated transaction IDs with different data.
@@ -51,18 +58,27 @@ def clean_uniswap_data(uniswap_filepath):
     df_uniswap[df_uniswap['id']==duplicates['id'].iloc[0]]
     return df_uniswap
 
-def clean_etherscan_data(etherscan_filepath):
-    """Loads and cleans Etherscan data.
-
-    Args:
-        filepath (str): Path to the Etherscan data file.
+def clean_etherscan_data():
+    """Loads and cleans Etherscan data, reading only the transaction hash and block number.
 
     Returns:
         pd.DataFrame: Cleaned Etherscan data.
     """
-    df_etherscan = pd.read_csv(etherscan_filepath)
+    df_etherscan = read_dataset('etherscan', columns=['hash', 'blockNumber'])
     return df_etherscan
 
+def subgraph_transaction_data(df_uniswap):
+    """Uses the transaction hash and block number fetched from the subgraph in place of the Etherscan data.
+
+    Args:
+        df_uniswap (pd.DataFrame): Cleaned Uniswap data with 'transaction.id' and 'transaction.blockNumber' columns.
+
+    Returns:
+        pd.DataFrame: Uniswap data with 'hash' and 'blockNumber' columns, as after the merge with Etherscan.
+    """
+    assert 'transaction.blockNumber' in df_uniswap.columns, "Uniswap data has no transaction.blockNumber, re-run api_uniswap.py or enable ETHERSCAN_ENRICHMENT"
+    return df_uniswap.rename(columns={'transaction.id': 'hash', 'transaction.blockNumber': 'blockNumber'})
+
 def preprocess_data(df):
     """Performs preprocessing operations on the data.
 
@@ -74,7 +90,8 @@ def preprocess_data(df):
     """
     df['timestamp'] = pd.to_datetime(df['timestamp'], unit='s').dt.tz_localize('UTC')
     df.sort_values(by='timestamp', inplace=True)
-    df['blockNumber'] = df['blockNumber'].apply(lambda x: int(x, 16))
+    if df['blockNumber'].dtype == object:  # Etherscan block numbers are hex encoded in older cleansed files
+        df['blockNumber'] = decode_hex(df['blockNumber'])
     df['size'] = df['amountUSD']
     df['width'] = df['tickUpper'] - df['tickLower']
     df['pool_price'] = np.nan
@@ -101,37 +118,39 @@ def infer_block_intervals(df_reduced):
         df_reduced (pd.DataFrame): Reduced data to calculate intervals.
 
     Returns:
-        Tuple[pd.DataFrame, pd.DataFrame, Dict[str, pd.DataFrame]]: Dataframes with block intervals and interval-based dataframes.
+        Tuple[pd.DataFrame, pd.DataFrame, IntervalOffsets]: Dataframes with block intervals and interval-based dataframes.
 
     Overall, this process involves calculating intervals based on specified columns, creating interval-based dataframes, and organizing them in a dictionary structure for further analysis and processing.
 
     Note -> For the blocks, the pair of reference blockNumber and pool should be unique.
     This allow us to use this pair as the index/hashid for interval_dataframes.
-    This hash is then used for future reference to get the pool and reference blockNumber.
+    The hashid packs the pair, (pool << 32) | blockNumber, so the pool and reference blockNumber are read back from it.
     See the generate_hash() function in build_intervals.py for more details or to change the hash generation.
     """
     df_blocks = calculate_intervals(df_reduced, 'pool', 'interval', SHIFT_PERIODS)
     df_blocks_full = calculate_other_intervals(df_blocks, 'pool')
-    interval_dataframes = create_interval_dataframes(df_blocks_full, df_reduced, 'pool')
+    interval_dataframes = create_interval_dataframes(df_blocks_full, EventStore.from_frame(df_reduced, 'pool'), 'pool')
     return df_blocks, df_blocks_full, interval_dataframes
 
 def save_interim_results(df_reduced, df_blocks, df_blocks_full, interval_dataframes, results_dir):
-    """Saves the interim results to CSV files and a pickle file.
+    """Saves the interim results as datasets (see environment/storage.py).
+
+    The interval dataframes are saved as their row offsets into the event store of df_reduced, saved alongside.
 
     Args:
         df_reduced (pd.DataFrame): Reduced data.
         df_blocks (pd.DataFrame): Data with block intervals.
         df_blocks_full (pd.DataFrame): Full data with block intervals.
-        interval_dataframes (Dict[str, pd.DataFrame]): Interval-based dataframes.
-        results_dir (str): Directory to save the results.
+        interval_dataframes (IntervalOffsets): Interval-based dataframes.
+        results_dir (str): Directory of the interim results.
     """
     os.makedirs(results_dir, exist_ok=True)
-    df_reduced.to_csv(os.path.join(results_dir, "df_reduced.csv"), index=False)
-    df_blocks.to_csv(os.path.join(results_dir, "df_blocks.csv"), index=False)
-    df_blocks_full.to_csv(os.path.join(results_dir, "df_blocks_full.csv"), index=False)
-    pickle_filepath = os.path.join(results_dir, "interval_dataframes.pickle")
-    with open(pickle_filepath, "wb") as pickle_file:
-        pickle.dump(interval_dataframes, pickle_file)
+    write_dataset(df_reduced, 'df_reduced')
+    write_dataset(df_blocks, 'df_blocks')
+    write_dataset(df_blocks_full, 'df_blocks_full')
+    write_dataset(hashid_translation(df_blocks), 'hashid_translation')
+    write_dataset(interval_dataframes.offsets, 'interval_offsets')
+    interval_dataframes.store.save(EVENT_STORE_PATH)
 
 def log_count_transaction_types(df, log_comment=''):
     """Logs the count of transaction types.
@@ -150,14 +169,17 @@ def log_count_transaction_types(df, log_comment=''):
 def main():
     ## DEX Data
     # Read uniswap cleansed data
-    df_uniswap = clean_uniswap_data(os.path.join(CLEANSED_FILEPATH, "uniswap.csv"))
+    df_uniswap = clean_uniswap_data()
 
-    # Read etherscan cleansed data
-    df_etherscan = clean_etherscan_data(os.path.join(CLEANSED_FILEPATH, "etherscan.csv"))
+    if ETHERSCAN_ENRICHMENT:
+        # Read etherscan cleansed data
+        df_etherscan = clean_etherscan_data()
 
-    # Merge uniswap and etherscan dataframes
-    df_dex = pd.merge(df_uniswap, df_etherscan, how='inner', left_on='id', right_on='hash')
-    print('Data loss after merge with etherscan: ', len(df_uniswap) - len(df_dex))
+        # Merge uniswap and etherscan dataframes
+        df_dex = pd.merge(df_uniswap, df_etherscan, how='inner', left_on='id', right_on='hash')
+        print('Data loss after merge with etherscan: ', len(df_uniswap) - len(df_dex))
+    else:
+        df_dex = subgraph_transaction_data(df_uniswap)
 
     # Preprocess the data and reduce mints on the same block
     df_dex_preprocessed = preprocess_data(df_dex)
@@ -1,14 +1,20 @@
 import os
-import pickle
+import sys
 import pandas as pd
 from tqdm import tqdm
 from utils.calculations import *
 from utils.common_functions import merge_nested_dicts
+from utils.event_store import EventStore
+from utils.interval_index import IntervalOffsets
+
+sys.path.append(os.getcwd())
+
+from environment.storage import read_dataset, write_dataset
 
 """
 This script processes data from different pools of a decentralized exchange (DEX) and computes various metrics per transaction hash and interval.
 It loads previously computed interval dataframes, applies various calculations to extract insights (such as trade volume, trade count, and volatility),
-and consolidates the results into a single dataframe per pool. If run directly, the processed data can be saved into a CSV file.
+and consolidates the results into a single dataframe per pool. If run directly, the processed data can be saved as the direct_pool dataset.
 It is part of a larger system for analyzing DEX data.
 """
 
@@ -28,12 +34,9 @@ class DEX_DirectPoolProcessor:
 
     def load_interval_dataframes(self):
         """
-        Load previously computed interval dataframes from a pickle file.
+        Load previously computed interval dataframes, from their row offsets into the memory-mapped event store.
         """
-        pickle_filepath = os.path.join(self.results_dir, "interval_dataframes.pickle")
-        with open(pickle_filepath, "rb") as pickle_file:
-            interval_dataframes = pickle.load(pickle_file)
-        return interval_dataframes
+        return IntervalOffsets.load(EventStore.open(), read_dataset('interval_offsets'))
 
     def process_data(self, intervals_dict, pool_type, pool_label=''):
         """
@@ -217,9 +220,9 @@ class DEX_DirectPoolProcessor:
         # Reorder dataframe columns
         df_direct_pool = df_direct_pool[order_cols]
 
-        # Write resulting dataframe to csv file if write=True
+        # Write resulting dataframe if write=True
         if self.write:
-            df_direct_pool.to_csv(f'{out_directory}/direct_pool.csv')
+            write_dataset(df_direct_pool, 'direct_pool')
 
 # Only run main function if script is run directly (not imported)
 if __name__ == '__main__':
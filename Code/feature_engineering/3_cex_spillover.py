@@ -1,41 +1,121 @@
 import os
+import sys
+import glob
 import pandas as pd
 import numpy as np
 from tqdm import tqdm
+from dotenv import load_dotenv
 from utils.build_intervals import create_interval_dataframes
 
+sys.path.append(os.getcwd())
+
+from environment.storage import read_dataset, write_dataset
+
 """
 This script loads, processes, and calculates metrics from the data of a Centralized Exchange (CEX),
 specifically Binance, relating to transactions'spillover effects on different pools of a decentralized exchange.
 The script organizes the data into intervals, calculates various metrics such as traded volume, mid price,
 and transaction count for each interval and each pool, and then consolidates the results.
-If the script is run directly, it can optionally save the processed data to a CSV file.
+If the script is run directly, it can optionally save the processed data as the cex_spillovers dataset.
 The calculated metrics can be used for further analysis of the spillover effects of CEX transactions on the DEX pools.
 This script is part of a larger system for analyzing CEX and DEX data.
+
+With CEX_ALIGNMENT = 'sparse', the raw Binance trades are mapped straight to the latest DEX block at or before their
+second (see align_trades_to_blocks) instead of going through the 1-second resampled data of binance-cleaning.
 """
 
 
-CLEANSED_FILEPATH = "Data/cleansed"
-ITERIM_RESULTS_DIR = "Data/interim_results"
-PROCESSED_DIR = "Data/processed"
+RAW_BINANCE_FILEPATH = "Data/binance.csv"
+RAW_BINANCE_PARTITIONS = "Data/binance"
+
+# CEX to DEX block alignment: 'sparse' (raw trades, one row per block) or 'resampled' (1-second cleansed data)
+CEX_ALIGNMENT = 'sparse'
+
+# Raw trades are read from the daily partitions when BINANCE_OUTPUT is 'columnar'
+load_dotenv('environment/run-config.env')
+BINANCE_OUTPUT = os.getenv("BINANCE_OUTPUT", "csv").strip()
+
+def block_seconds(timestamps):
+    """Converts block timestamps (datetimes, or their text in a CSV) to UNIX seconds."""
+    return ((pd.to_datetime(timestamps, utc=True) - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(seconds=1)).values
+
+def align_trades_to_blocks(df_blocks, df_trades):
+    """
+    Aggregates raw CEX trades per DEX block, without resampling to seconds.
+
+    Every trade is assigned to the latest block mined at or before the second of the trade, with a sorted search
+    over the block timestamps, which is the block the 1-second resampled rows are forward filled from. Volume,
+    count and price sums are then accumulated per block. Blocks without trades get a zero volume and count and
+    carry the mid price of the previous block. Trades before the first block are dropped.
+
+    Args:
+        df_blocks (pd.DataFrame): Blocks with 'blockNumber' and 'timestamp'.
+        df_trades (pd.DataFrame): Raw trades with 'time' (ms), 'price' and 'quoteQty'.
+
+    Returns:
+        pd.DataFrame: One row per block with blockNumber, CEX_traded_volume_BTC, CEX_mid_price and CEX_transactions_count.
+    """
+    blocks = df_blocks[['blockNumber', 'timestamp']].drop_duplicates()
+    blocks = blocks.assign(seconds=block_seconds(blocks['timestamp'])).sort_values(['seconds', 'blockNumber'])
+    blocks = blocks.drop_duplicates('seconds', keep='last')
+    seconds = blocks['seconds'].values
+
+    position = np.searchsorted(seconds, df_trades['time'].values // 1000, side='right') - 1
+    in_range = position >= 0
+    position = position[in_range]
+    price = df_trades['price'].values[in_range]
+    volume = df_trades['quoteQty'].values[in_range] * price
+
+    count = np.bincount(position, minlength=len(seconds))
+    price_sum = np.bincount(position, weights=price, minlength=len(seconds))
+    mid_price = np.divide(price_sum, count, out=np.full(len(seconds), np.nan), where=count > 0)
+
+    return pd.DataFrame({
+        'blockNumber': blocks['blockNumber'].values,
+        'CEX_traded_volume_BTC': np.bincount(position, weights=volume, minlength=len(seconds)),
+        'CEX_mid_price': pd.Series(mid_price).ffill().values,
+        'CEX_transactions_count': count
+    })
 
 class CEX_SpilloverProcessor:
-    def __init__(self, interim_results_dir=ITERIM_RESULTS_DIR, binance_filepath=os.path.join(CLEANSED_FILEPATH, "binance.csv")):
-        self.interim_results_dir = interim_results_dir
-        self.binance_filepath = binance_filepath
+    def __init__(self, alignment=CEX_ALIGNMENT):
+        self.alignment = alignment
 
     def _get_block_times_map(self, df_blocks_full):
-        return df_blocks_full[['blockNumber', 'timestamp']].drop_duplicates().set_index('timestamp').to_dict()
+        # Keyed by the text of the timestamps, which is what a CSV holds
+        df_block_times = df_blocks_full[['blockNumber', 'timestamp']].astype({'timestamp': str}).drop_duplicates()
+        return df_block_times.set_index('timestamp').to_dict()
+
+    def _read_raw_trades(self, df_blocks_full, sample):
+        """Reads the raw trades of the days spanned by the blocks (the first day only for a sample)."""
+        seconds = block_seconds(df_blocks_full['timestamp'])
+        first_day, last_day = pd.to_datetime([seconds.min(), seconds.max()], unit='s').strftime('%Y-%m-%d')
+        last_day = first_day if sample else last_day
+        columns = ['price', 'quoteQty', 'time']
+        if BINANCE_OUTPUT == 'columnar':
+            paths = sorted(glob.glob(os.path.join(RAW_BINANCE_PARTITIONS, 'date=*', '*.parquet')))
+            days = [os.path.basename(os.path.dirname(path))[len('date='):] for path in paths]
+            paths = [path for path, day in zip(paths, days) if first_day <= day <= last_day]
+            if not paths:
+                # Binance ingestion has not run for the span: the blocks get no CEX trades
+                print(f"No Binance partitions between {first_day} and {last_day} in {RAW_BINANCE_PARTITIONS}")
+                return pd.DataFrame({'price': pd.Series(dtype='float64'), 'quoteQty': pd.Series(dtype='float64'),
+                                     'time': pd.Series(dtype='int64')})
+            df_trades = pd.concat([pd.read_parquet(path, columns=columns) for path in paths], ignore_index=True)
+        else:
+            df_trades = pd.read_csv(RAW_BINANCE_FILEPATH, usecols=columns, nrows=100000 if sample else None)
+        return df_trades.sort_values('time', kind='stable')
 
     def _import_data(self, sample):
-        df_blocks_full = pd.read_csv(os.path.join(self.interim_results_dir, "df_blocks_full.csv"))
-        block_times_map = self._get_block_times_map(df_blocks_full)
+        df_blocks_full = read_dataset('df_blocks_full')
         pool_flags = list(df_blocks_full['pool'].unique())
 
-        if sample:
-            df_cex = pd.read_csv(os.path.join(self.binance_filepath), nrows=100000)
-        else:
-            df_cex = pd.read_csv(os.path.join(self.binance_filepath))
+        if self.alignment == 'sparse':
+            df_cex_reference = align_trades_to_blocks(df_blocks_full, self._read_raw_trades(df_blocks_full, sample))
+            return df_blocks_full, self._replicate_pools(df_cex_reference, pool_flags)
+
+        block_times_map = self._get_block_times_map(df_blocks_full)
+        df_cex = read_dataset('binance', nrows=100000 if sample else None)
 
         df_cex['time'] = pd.to_datetime(df_cex['time'])
         df_cex['closest_blockNumber'] = pd.Series([block_times_map['blockNumber'].get(str(time), None) for time in df_cex['time']]).ffill().fillna(-1).astype(int)
@@ -48,13 +128,16 @@ class CEX_SpilloverProcessor:
 
         df_cex_reference = df_cex.groupby('closest_blockNumber').agg(agg_dict).reset_index().rename(columns={'closest_blockNumber': 'blockNumber'})
 
+        return df_blocks_full, self._replicate_pools(df_cex_reference, pool_flags)
+
+    def _replicate_pools(self, df_cex_reference, pool_flags):
         df_cex_full = pd.DataFrame()
         for pool_flag in pool_flags:
             df_cex_pool = df_cex_reference.copy(deep=True)
             df_cex_pool['pool'] = pool_flag
             df_cex_full = pd.concat([df_cex_full, df_cex_pool])
 
-        return df_blocks_full, df_cex_full
+        return df_cex_full
 
     def _calculate_metrics(self, df_interval):
         agg_dict = {
@@ -118,7 +201,7 @@ class CEX_SpilloverProcessor:
 
         df_cex_spillovers = df_cex_spillovers[order_cols]
         if write:
-            df_cex_spillovers.to_csv(os.path.join(PROCESSED_DIR, 'cex_spillovers.csv'))
+            write_dataset(df_cex_spillovers, 'cex_spillovers')
 
 if __name__ == '__main__':
     processor = CEX_SpilloverProcessor()
@@ -1,42 +1,22 @@
 import os
-import pandas as pd
+import sys
 from utils.horizon_aggregates import calculate_horizons, organize_target_data_on_horizons
+from utils.event_store import EventStore
+from utils.build_intervals import unpack_hashid
 
-interim_results_dir = "Data/interim_results"
-processed_results_dir = "Data/processed"
+sys.path.append(os.getcwd())
+
+from environment.storage import read_dataset, write_dataset
 
 """
 This script serves as the final phase in feature engineering, aggregating and processing the outputs from previous engineering stages,
 along with calculated horizon data. The script's primary task is to calculate the cumulative volume of various pools,
 merging them with Centralized Exchange (CEX) and Decentralized Exchange (DEX) features.
 The processed data is then arranged into Horizon tables for each pool, providing a foundation for subsequent predictive modeling.
-Upon successful execution, the script outputs the processed data into CSV files, each file pertaining to a specific pool.
+Upon successful execution, the script outputs the processed data as one features dataset per pool.
 This transformation refines the raw and intermediate data into a form that's readily usable for building predictive models.
 """
 
-# Directory path
-out_directory = 'Data/processed/features'
-
-# Check if the directory exists, if not, create it
-if not os.path.exists(out_directory):
-    os.makedirs(out_directory)
-
-def load_data(path, filename):
-    """
-    Load a CSV file from a directory
-    """
-    return pd.read_csv(os.path.join(path, filename), index_col=0)
-
-def get_blocks():
-    """
-    Load blocks data and filter it for relevant columns
-    """
-    df_blocks_full = load_data(interim_results_dir, "df_blocks_full.csv")
-    df_blocks = df_blocks_full[['blockNumber', 'pool']]
-    df_blocks = df_blocks.rename(columns={'blockNumber': 'reference_blockNumber'})
-    df_blocks['reference_blockNumber'] = df_blocks['reference_blockNumber'].astype(int)
-    return df_blocks
-
 def calculate_and_organize_horizons(df):
     """
     Calculate horizons and organize data on horizons
@@ -45,11 +25,14 @@ def calculate_and_organize_horizons(df):
     dict_target_horizons = organize_target_data_on_horizons(df, dict_horizons)
     return dict_target_horizons
 
-def expand_horizons_with_features(df, df_blocks):
+def expand_horizons_with_features(df):
     """
     Expand horizons with direct pool or dex spillover features (or others...)
+
+    The reference blockNumber and pool of each row are unpacked from its hashid index, instead of merging with the blocks.
     """
-    return df.merge(df_blocks, how='left', left_index=True, right_on='hashid')
+    pools, block_numbers = unpack_hashid(df.index)
+    return df.assign(reference_blockNumber=block_numbers, pool=pools)
 
 def compute_data_loss_percentage(old_len, new_len):
     """
@@ -77,16 +60,15 @@ def process_pool(pool, dict_target_horizons, df_direct_pool_blocks, df_cex_spill
     print('Data loss after merge with cex spillovers pools: ', len(df_dex_features) - len(df))
     print('Data loss as a percentage: %.2f%%' % data_loss_percentage)
 
-    df.to_csv(os.path.join(processed_results_dir, 'features', f"df_features_raw_ref{pool}.csv"), index=False)
+    write_dataset(df, 'features', pool=pool)
 
 # Main execution
-df_blocks = get_blocks()
-df_dex = load_data(interim_results_dir, "df_reduced.csv")
+df_dex = EventStore.open().frame(columns=['transaction_type', 'pool', 'blockNumber', 'amountUSD'])
 dict_target_horizons = calculate_and_organize_horizons(df_dex)
-df_direct_pool_blocks = expand_horizons_with_features(load_data(processed_results_dir, "direct_pool.csv"), df_blocks)
-df_cex_spillovers_blocks = expand_horizons_with_features(load_data(processed_results_dir, "cex_spillovers.csv"), df_blocks)
+df_direct_pool_blocks = expand_horizons_with_features(read_dataset('direct_pool'))
+df_cex_spillovers_blocks = expand_horizons_with_features(read_dataset('cex_spillovers'))
 
-unique_pools = list(df_blocks['pool'].unique())
+unique_pools = list(df_direct_pool_blocks['pool'].unique())
 unique_pools.insert(0, 'base')
 
 for pool in unique_pools:
@@ -6,9 +6,92 @@ Need to adapt all other functions to work at block level (as per mints)
 from tqdm import tqdm
 import pandas as pd
 import numpy as np
-import ast
+import re
 import zlib
 import copy
+from utils.event_store import EventStore
+from utils.interval_index import IntervalOffsets, OFFSET_COLUMNS
+
+# Fill value of the missing links at the end of a block number chain
+CHAIN_SENTINEL = -1
+
+def chain_columns(chain_col, depth):
+    """
+    Names of the columns holding a block number chain, one per link: blockNumberChain_0, blockNumberChain_1, ...
+    """
+    return [f'{chain_col}_{i}' for i in range(depth)]
+
+def chain_matrix(df, chain_col):
+    """
+    Read a block number chain as an int64 matrix, one row per block and one column per link, in descending block
+    order with CHAIN_SENTINEL for the missing links.
+
+    Args:
+        df (DataFrame): DataFrame with the chain_col_0, chain_col_1, ... columns.
+        chain_col (str): Name of the chain, e.g. 'blockNumberChain' or 'other_blockNumberChain'.
+
+    Returns:
+        np.ndarray: The chains, of shape (len(df), depth).
+    """
+    columns = [column for column in df.columns if re.fullmatch(f'{chain_col}_\\d+', column)]
+    columns = sorted(columns, key=lambda column: int(column.rsplit('_', 1)[1]))
+    return df[columns].to_numpy(dtype=np.int64)
+
+# Bits of the blockNumber in a hashid, the pool taking the bits above
+BLOCK_BITS = 32
+
+def pack_hashid(pools, block_numbers):
+    """
+    Pack pools and block numbers into int64 hashids, (pool << 32) | blockNumber.
+
+    Unlike a hash, the key is unique for every (pool, blockNumber) pair and both are read back with unpack_hashid.
+
+    Args:
+        pools (array-like): Pool of each block (fee tier).
+        block_numbers (array-like): Block numbers.
+
+    Returns:
+        np.ndarray: int64 hashids.
+    """
+    pools = np.asarray(pools, dtype=np.int64)
+    block_numbers = np.asarray(block_numbers, dtype=np.int64)
+    assert ((block_numbers >= 0) & (block_numbers < 1 << BLOCK_BITS)).all(), "blockNumber does not fit in the hashid"
+    assert ((pools >= 0) & (pools < 1 << (63 - BLOCK_BITS))).all(), "pool does not fit in the hashid"
+    return (pools << BLOCK_BITS) | block_numbers
+
+def unpack_hashid(hashids):
+    """
+    Read the pools and block numbers back from hashids made by pack_hashid.
+
+    Args:
+        hashids (array-like): int64 hashids.
+
+    Returns:
+        tuple: (pools, block_numbers) int64 arrays.
+    """
+    hashids = np.asarray(hashids, dtype=np.int64)
+    return hashids >> BLOCK_BITS, hashids & ((1 << BLOCK_BITS) - 1)
+
+def crc32_hashid(pools, block_numbers):
+    """
+    The former hashids, crc32 of the pool and blockNumber text, for translating results keyed by them.
+    """
+    return np.fromiter((zlib.crc32((str(pool) + str(block_number)).encode()) for pool, block_number in zip(pools, block_numbers)),
+                       dtype=np.int64, count=len(pools))
+
+def hashid_translation(df_blocks):
+    """
+    Table translating the former crc32 hashids of the blocks to their packed hashids.
+
+    Args:
+        df_blocks (DataFrame): Blocks with 'hashid', 'pool' and 'blockNumber'.
+
+    Returns:
+        DataFrame: One row per block with hashid, crc32_hashid, pool and blockNumber.
+    """
+    pools, block_numbers = df_blocks['pool'].tolist(), df_blocks['blockNumber'].tolist()
+    return pd.DataFrame({'hashid': df_blocks['hashid'].to_numpy(), 'crc32_hashid': crc32_hashid(pools, block_numbers),
+                         'pool': pools, 'blockNumber': block_numbers})
 
 def generate_hash(df):
     # Convert timestamp column to datetime
@@ -17,12 +100,11 @@ def generate_hash(df):
     # Sort the DataFrame by timestamp in ascending order
     df_sorted = df.sort_values(by='timestamp')
 
-    # Generate hashids based on the sorted index
-    df_sorted['hashid'] = df_sorted.apply(lambda row: zlib.crc32((str(row['pool']) + str(row['blockNumber'])).encode()), axis=1)
-
     # Validate uniqueness of reference blockNumber and pool
     assert df_sorted[['blockNumber', 'pool']].duplicated().any() == False, "Reference blockNumber and pool are not unique"
-    assert df_sorted['hashid'].duplicated().any() == False, "hashid is not unique"
+
+    # Generate hashids packing the pool and blockNumber, unique as the pairs are
+    df_sorted['hashid'] = pack_hashid(df_sorted['pool'], df_sorted['blockNumber'])
 
     return df_sorted
 
@@ -37,28 +119,28 @@ def calculate_intervals(df, pool_col, interval_col, l_values):
         l_values (list): List of values for calculating intervals.
 
     Returns:
-        DataFrame: Hashed dataframe containing the calculated intervals.
+        DataFrame: Hashed dataframe containing the calculated intervals, as the blockNumberChain_<i> columns.
 
     """
     dfs = []  # List to store the modified dataframes
     df = df.copy()
     df = df[df['transaction_type'] == 'mints']
     df = df[['pool', 'blockNumber', 'timestamp']]
+    columns = chain_columns('blockNumberChain', len(l_values))
     for pool in df[pool_col].unique():
         df_pool = df[df[pool_col] == pool].copy()  # Create a copy of the slice
-        for l in l_values:
-            df_pool[f'{interval_col}_{l}'] = df_pool['blockNumber'].shift(l)
+        shifted = [df_pool['blockNumber'].shift(l, fill_value=CHAIN_SENTINEL).to_numpy() for l in l_values]
 
-        # Create a new column for the block number chain
-        block_numbers = df_pool[[f'{interval_col}_{l}' for l in l_values]].apply(lambda row: sorted(row, reverse=True), axis=1)
-        df_pool['blockNumberChain'] = block_numbers
+        # Create the block number chain columns, each row sorted in descending order (missing links last)
+        block_numbers = -np.sort(-np.column_stack(shifted).astype(np.int64), axis=1)
+        df_pool[columns] = block_numbers
 
         dfs.append(df_pool)  # Append the modified dataframe to the list
 
     df_merged = pd.concat(dfs)  # Concatenate all dataframes
     df_hashed = generate_hash(df_merged)
     
-    return df_hashed[['hashid', 'pool', 'timestamp', 'blockNumber', 'blockNumberChain']]
+    return df_hashed[['hashid', 'pool', 'timestamp', 'blockNumber'] + columns]
 
 def calculate_other_intervals(df, pool_col):
     """
@@ -68,7 +150,8 @@ def calculate_other_intervals(df, pool_col):
         df (DataFrame): Input DataFrame.
         pool_col (str): Name of the column representing the pool.
     Returns:
-        DataFrame: Dataframe containing the calculated intervals for 'other' pool.
+        DataFrame: Dataframe containing the calculated intervals for 'other' pool, as the other_blockNumberChain_<i>
+            columns.
 
     """
     # Initialise empty dataframe
@@ -82,26 +165,25 @@ def calculate_other_intervals(df, pool_col):
         df_other = df[df['pool'] != pool_same].copy().reset_index(drop=True).copy(deep=True)
 
         # Calculate intervals for other pool
-        # Get length of blockNumberChain and set default other_blockNumberChain
-        chain_length = len(df['blockNumberChain'].iloc[0])
-        df_same['other_blockNumberChain'] = [[np.nan]*chain_length]*df_same.shape[0]
-        for i in range(len(df_same)):
-            reference_block = df_same.loc[i, 'blockNumber']
-            max_block_pool2 = df_other.loc[(df_other['blockNumber'] < reference_block), 'blockNumber'].max()
-
-            other_chain_raw = df_other.loc[df_other['blockNumber'] == max_block_pool2, 'blockNumberChain'].values
-            if other_chain_raw.shape[0] == 0:
-                # leave default
-                other_chain = df_same.loc[i, 'other_blockNumberChain'][:]
-            else:
-                other_chain = other_chain_raw[0][:]
-
-            # insert reference block at the start of the chain
-            if np.isnan(other_chain[0]) or int(other_chain[0]) != reference_block:
-                other_chain.insert(0, reference_block)
-                other_chain = other_chain[:-1][:]
-
-            df_same.loc[i, 'other_blockNumberChain'] = str(other_chain)
+        # Sort the other pool blocks once (stable, so equal blocks keep their order) and find, with one search for
+        # all the reference blocks, the latest other pool block before each of them
+        blocks_other = df_other['blockNumber'].to_numpy()
+        order = np.argsort(blocks_other, kind='stable')
+        sorted_blocks = blocks_other[order]
+        reference_blocks = df_same['blockNumber'].to_numpy()
+        latest = np.searchsorted(sorted_blocks, reference_blocks, side='left') - 1
+        found = latest >= 0
+        # First row of the other pool holding that block
+        rows = order[np.searchsorted(sorted_blocks, sorted_blocks[latest[found]], side='left')]
+
+        # The other chain is the reference block followed by the chain of that block, without its last link,
+        # or the reference block alone (default) when the other pool has no earlier block
+        chains_other = chain_matrix(df_other, 'blockNumberChain')
+        other_chains = np.full((len(df_same), chains_other.shape[1]), CHAIN_SENTINEL, dtype=np.int64)
+        other_chains[:, 0] = reference_blocks
+        other_chains[found, 1:] = chains_other[rows, :-1]
+
+        df_same[chain_columns('other_blockNumberChain', other_chains.shape[1])] = other_chains
 
         # Append to result_df
         result_df = pd.concat([result_df, df_same])
@@ -112,80 +194,70 @@ def create_interval_dataframes(df_blocks, df, pool_col):
     """
     Create interval-based dataframes based on specified columns.
 
+    The intervals are not copied out of df: each is stored as the row range of its events in an EventStore
+    (see utils/interval_index.py), and its DataFrame is sliced from it when accessed. The events are sorted once
+    and every (interval_end, interval_start] window is found with binary searches, for all the blocks at once.
+
     Args:
         df_blocks (DataFrame): DataFrame containing block information.
-        df (DataFrame): DataFrame containing the main data.
-        end_col (str): Name of the column representing the end of the interval.
+        df (DataFrame or EventStore): DataFrame containing the main data, or the event store built from it.
         pool_col (str): Name of the column representing the pool.
 
     Returns:
-        dict: A nested dictionary with interval-based dataframes, where the keys are the hash IDs.
+        IntervalOffsets: A nested mapping with interval-based dataframes, where the keys are the hash IDs.
 
     """
-
-    def update_interval(chain_col, df_blocks, df):
-        
-        dataframes = {}
-        for _, row in df_blocks.iterrows():
-            ## For debugging specific hashes
-            # if row['hashid'] == 576279937:
-            #     pass
-            chain = row[chain_col]
-            if isinstance(chain, str): 
-                chain = chain.replace('nan', 'None')
-                chain = ast.literal_eval(chain)
-                chain = [np.nan if val is None else val for val in chain]
-            max_index = max((i for i, x in enumerate(chain) if not np.isnan(x)), default=None)
-
-            reference_start = int(chain[0])
-            for i in range(max_index):
-                interval_start = int(chain[i])
-                interval_end = int(chain[i+1])
-                if pd.notna(interval_start) and pd.notna(interval_end):
-                    df_interval = df[(df['blockNumber'] <= interval_start) & (df['blockNumber'] > interval_end)].copy()
-                    if row['hashid'] not in dataframes:
-                        dataframes[row['hashid']] = {}
-
-                    key = i
-                    dataframes[row['hashid']][key] = {
-                        'blockTime': reference_start - interval_end,
-                        'df': df_interval}
-            if max_index > 0:
-                # Get last mint operation
-                interval_end = int(chain[i+1])
-                if pd.notna(interval_start) and pd.notna(interval_end):
-                    df_interval = df[df['blockNumber'] == interval_end].copy()
-
-                    key = i+1
-                    dataframes[row['hashid']][key] = {
-                        'blockTime': reference_start - interval_end,
-                        'df': df_interval}
-        
-        return dataframes
-
-    # Initialise empty dictionary store
-    interval_dataframes = {}
+    store = df if isinstance(df, EventStore) else EventStore.from_frame(df, pool_col)
+
+    def update_interval(chain_col, df_blocks, event_pools, pool_same, side):
+        """
+        Offsets of every link of every chain, found with two binary searches per link and event pool over the
+        block index of the store, for all the chains at once.
+        """
+        chains = chain_matrix(df_blocks, chain_col)
+        # Index of the last block of each chain, the missing links being at the end
+        max_indices = (chains != CHAIN_SENTINEL).sum(axis=1) - 1
+
+        # One (row, interval) pair per link of the chains with more than one block, ordered by row then interval
+        rows, intervals = np.nonzero((np.arange(chains.shape[1]) <= max_indices[:, None]) & (max_indices > 0)[:, None])
+        last = intervals == max_indices[rows]
+        interval_start = chains[rows, intervals]
+        # Interval i covers (chain[i+1], chain[i]], the last one the block of the last mint operation alone
+        interval_end = np.where(last, interval_start, chains[rows, np.minimum(intervals + 1, chains.shape[1] - 1)])
+        low = np.where(last, interval_start - 1, interval_end)
+
+        # An interval over several pools has one range per pool, in pool order (an empty one without event pools)
+        ranges = [store.block_ranges(pool, low, interval_start) for pool in event_pools]
+        ranges = ranges or [(np.zeros(len(rows), dtype=np.int64), np.zeros(len(rows), dtype=np.int64))]
+        return pd.DataFrame({
+            'pool': pool_same,
+            'side': side,
+            'hashid': np.repeat(df_blocks['hashid'].to_numpy()[rows], len(ranges)),
+            'interval': np.repeat(intervals, len(ranges)),
+            'start_row': np.stack([start_rows for start_rows, _ in ranges], axis=1).ravel(),
+            'end_row': np.stack([end_rows for _, end_rows in ranges], axis=1).ravel(),
+            'blockTime': np.repeat(chains[rows, 0] - interval_end, len(ranges)),
+        }, columns=OFFSET_COLUMNS)
+
+    # Initialise empty offsets store
+    offsets = []
 
     # Get unique pool values
-    unique_pools = df[pool_col].unique()
+    unique_pools = store.pools if isinstance(df, EventStore) else df[pool_col].unique()
 
     for pool_same in unique_pools:
 
-        pools = {}
+        # Get same and other pools (to get intervals)
+        other_pools = [pool for pool in unique_pools if pool != pool_same]
 
-        # Get same and other pool dataframes (to get intervals)
-        df_same = df[df[pool_col] == pool_same].copy(deep=True).reset_index(drop=True)
-        df_other = df[df[pool_col] != pool_same].copy(deep=True).reset_index(drop=True)
-
-        # Get same pool blocks (these should already have  blockNumberChain and other_blockNumberChain)
+        # Get same pool blocks (these should already have the blockNumberChain and other_blockNumberChain columns)
         df_blocks_same = df_blocks[df_blocks[pool_col] == pool_same].copy(deep=True).reset_index(drop=True)
         
-        pools['same'] = update_interval('blockNumberChain', df_blocks_same, df_same)
-        pools['other'] = update_interval('other_blockNumberChain', df_blocks_same, df_other)
-
-        interval_dataframes[pool_same] = pools
+        offsets.append(update_interval('blockNumberChain', df_blocks_same, [pool_same], pool_same, 'same'))
+        offsets.append(update_interval('other_blockNumberChain', df_blocks_same, other_pools, pool_same, 'other'))
 
-    return interval_dataframes
+    offsets = pd.concat(offsets, ignore_index=True) if offsets else pd.DataFrame(columns=OFFSET_COLUMNS)
+    return IntervalOffsets(store, offsets)
 
 def reduce_mints(df):
     """
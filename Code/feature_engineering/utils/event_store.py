@@ -0,0 +1,217 @@
+"""
+Block-indexed event store.
+
+Holds the DEX events (df_reduced) as one numpy array per column, sorted by pool and blockNumber, with a block
+index giving the first row of every distinct block of each pool. Any block range of a pool resolves to a row range
+with a binary search over the block index, and the columns of that range are views of the arrays, no rows are
+copied or scanned.
+
+On disk (Data/interim_results/event_store) every column is a .npy file opened memory-mapped, so opening the store
+does not read the events, whatever the length of the span; pages are loaded as the ranges are accessed.
+Text columns are stored as int8/int16/int32 codes with their categories, and timezone-aware timestamps as int64
+nanoseconds, both listed in meta.json.
+
+Usage:
+    store = EventStore.from_frame(df_reduced)
+    store.save(EVENT_STORE_PATH)
+    store = EventStore.open(EVENT_STORE_PATH)
+    start, stop = store.block_range(500, 15000000, 15000100)   # rows with 15000000 < blockNumber <= 15000100
+    df = store.frame(start, stop, columns=['blockNumber', 'amountUSD'])
+"""
+
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+
+EVENT_STORE_PATH = 'Data/interim_results/event_store'
+
+
+def sort_events(df, pool_col='pool'):
+    """
+    Order the events by pool and blockNumber, keeping the order of equal keys, so every block range of a pool
+    is a contiguous run of rows.
+    """
+    return df.sort_values([pool_col, 'blockNumber'], kind='stable').reset_index(drop=True)
+
+
+def run_starts(values):
+    """Positions where a run of equal values starts in an array."""
+    if len(values) == 0:
+        return np.array([], dtype=np.int64)
+    return np.flatnonzero(np.r_[True, values[1:] != values[:-1]])
+
+
+class EventStore:
+    """
+    Events sorted by pool and blockNumber, with a block offset index.
+
+    Args:
+        columns (dict): Column name to numpy array (or memmap), all of the same length, sorted by pool and blockNumber.
+        categories (dict): Categories of the columns stored as codes.
+        timezones (dict): Timezone of the timestamp columns stored as int64 nanoseconds.
+        pool_col (str): Name of the column representing the pool.
+        index (dict): Block index as written by save, built from the columns when not given.
+    """
+
+    def __init__(self, columns, categories=None, timezones=None, pool_col='pool', index=None):
+        self.columns = columns
+        self.categories = categories or {}
+        self.timezones = timezones or {}
+        self.pool_col = pool_col
+        # Lookup arrays decoding the codes and timestamps of a range; the code -1 of missing values maps to the
+        # trailing None
+        self.labels = {column: np.asarray(list(labels) + [None], dtype=object) for column, labels in self.categories.items()}
+        self.timestamp_types = {column: pd.DatetimeTZDtype(tz=tz) for column, tz in self.timezones.items()}
+        if index is None:
+            index = self._build_index()
+        self.pools = index['pools']
+        self.block_numbers = index['block_numbers']
+        self.block_rows = index['block_rows']
+        # Pool to its (first, last + 1) positions in the block index
+        bounds = list(index['pool_blocks']) + [len(self.block_numbers)]
+        self.segments = {pool: (bounds[i], bounds[i + 1]) for i, pool in enumerate(self.pools)}
+
+    def _build_index(self):
+        pools = self.columns[self.pool_col]
+        block_numbers = self.columns['blockNumber']
+        # A block starts where the pool or the blockNumber changes
+        changes = np.r_[True, (pools[1:] != pools[:-1]) | (block_numbers[1:] != block_numbers[:-1])] if len(pools) else np.array([], dtype=bool)
+        first_rows = np.flatnonzero(changes)
+        pool_starts = run_starts(pools)
+        return {
+            'pools': pools[pool_starts].tolist(),
+            'pool_blocks': np.searchsorted(first_rows, pool_starts).tolist(),
+            'block_numbers': np.asarray(block_numbers[first_rows]),
+            'block_rows': np.r_[first_rows, len(pools)].astype(np.int64),
+        }
+
+    @classmethod
+    def from_frame(cls, df, pool_col='pool'):
+        """
+        Build an in-memory store from a DataFrame of events, sorting them with sort_events.
+
+        Args:
+            df (pd.DataFrame): Events with at least pool_col and 'blockNumber'.
+            pool_col (str): Name of the column representing the pool.
+
+        Returns:
+            EventStore: The store.
+        """
+        df = sort_events(df, pool_col)
+        columns, categories, timezones = {}, {}, {}
+        for column in df.columns:
+            series = df[column]
+            if isinstance(series.dtype, pd.DatetimeTZDtype):
+                timezones[column] = str(series.dtype.tz)
+                columns[column] = series.array.asi8
+            elif pd.api.types.is_numeric_dtype(series.dtype) or pd.api.types.is_datetime64_dtype(series.dtype):
+                columns[column] = np.ascontiguousarray(series.to_numpy())
+            else:
+                codes, uniques = pd.factorize(series)
+                categories[column] = [str(value) for value in uniques]
+                columns[column] = codes.astype(np.min_scalar_type(-len(uniques) - 1))
+        return cls(columns, categories, timezones, pool_col)
+
+    @classmethod
+    def open(cls, path=EVENT_STORE_PATH):
+        """Open a saved store, memory-mapping its columns and index."""
+        with open(os.path.join(path, 'meta.json'), 'r') as file:
+            meta = json.load(file)
+        columns = {column: np.load(os.path.join(path, f'{column}.npy'), mmap_mode='r') for column in meta['columns']}
+        index = {
+            'pools': meta['pools'],
+            'pool_blocks': meta['pool_blocks'],
+            'block_numbers': np.load(os.path.join(path, 'index', 'block_numbers.npy'), mmap_mode='r'),
+            'block_rows': np.load(os.path.join(path, 'index', 'block_rows.npy'), mmap_mode='r'),
+        }
+        return cls(columns, meta['categories'], meta['timezones'], meta['pool_col'], index)
+
+    def save(self, path=EVENT_STORE_PATH):
+        """Write the columns and the block index as .npy files, with their metadata in meta.json."""
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.makedirs(os.path.join(path, 'index'), exist_ok=True)
+        for column, values in self.columns.items():
+            np.save(os.path.join(path, f'{column}.npy'), values)
+        np.save(os.path.join(path, 'index', 'block_numbers.npy'), self.block_numbers)
+        np.save(os.path.join(path, 'index', 'block_rows.npy'), self.block_rows)
+        meta = {
+            'columns': list(self.columns), 'categories': self.categories, 'timezones': self.timezones,
+            'pool_col': self.pool_col, 'pools': self.pools,
+            'pool_blocks': [self.segments[pool][0] for pool in self.pools],
+        }
+        with open(os.path.join(path, 'meta.json'), 'w') as file:
+            json.dump(meta, file)
+
+    def __len__(self):
+        return int(self.block_rows[-1]) if len(self.block_rows) else 0
+
+    def pool_range(self, pool):
+        """Rows of all the events of a pool."""
+        first, last = self.segments[pool]
+        return int(self.block_rows[first]), int(self.block_rows[last])
+
+    def block_range(self, pool, low, high):
+        """
+        Rows of the events of a pool with low < blockNumber <= high, found with binary searches over the block index.
+
+        Args:
+            pool: Pool of the events, empty range if the store has none.
+            low (int): Exclusive lower block number.
+            high (int): Inclusive upper block number.
+
+        Returns:
+            tuple: (start, stop) rows.
+        """
+        start_rows, stop_rows = self.block_ranges(pool, [low], [high])
+        return int(start_rows[0]), int(stop_rows[0])
+
+    def block_ranges(self, pool, low, high):
+        """
+        Rows of many block ranges of a pool at once, as block_range.
+
+        Args:
+            pool: Pool of the events, empty ranges if the store has none.
+            low (array-like): Exclusive lower block numbers.
+            high (array-like): Inclusive upper block numbers.
+
+        Returns:
+            tuple: (start, stop) int64 arrays of rows.
+        """
+        low, high = np.asarray(low), np.asarray(high)
+        if pool not in self.segments:
+            return np.zeros(len(low), dtype=np.int64), np.zeros(len(low), dtype=np.int64)
+        first, last = self.segments[pool]
+        blocks = self.block_numbers[first:last]
+        start = first + np.searchsorted(blocks, low, side='right')
+        stop = first + np.searchsorted(blocks, high, side='right')
+        return np.asarray(self.block_rows[start]), np.asarray(self.block_rows[np.maximum(start, stop)])
+
+    def rows(self, start=0, stop=None, columns=None):
+        """Views of the stored arrays over a row range, keyed by column (codes for text columns)."""
+        return {column: self.columns[column][start:stop] for column in (columns or self.columns)}
+
+    def frame(self, start=0, stop=None, columns=None):
+        """
+        Build a DataFrame of a row range, decoding the text and timestamp columns.
+
+        Args:
+            start (int): First row.
+            stop (int): Last row + 1, the end of the store by default.
+            columns (list): Columns to read, all by default.
+
+        Returns:
+            pd.DataFrame: The events, indexed by their rows in the store.
+        """
+        stop = len(self) if stop is None else stop
+        data = {}
+        for column, values in self.rows(start, stop, columns).items():
+            if column in self.labels:
+                data[column] = self.labels[column][values]
+            elif column in self.timestamp_types:
+                data[column] = pd.arrays.DatetimeArray(np.asarray(values).view('M8[ns]'), dtype=self.timestamp_types[column])
+            else:
+                data[column] = values
+        return pd.DataFrame(data, index=pd.RangeIndex(start, stop))
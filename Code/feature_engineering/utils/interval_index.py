@@ -0,0 +1,96 @@
+"""
+Offsets-based interval index.
+
+create_interval_dataframes used to hold a copy of the events of every hash and interval, so the same rows were
+repeated across overlapping chains. Here the events are kept once, in an EventStore sorted by pool and blockNumber
+(see utils/event_store.py), and every interval is stored as (start_row, end_row, blockTime) into it. IntervalOffsets
+exposes the same nested mapping as the original dictionary, building the interval DataFrames lazily from the rows
+of the store:
+
+    {pool: {'same' | 'other': {hashid: {interval: {'blockTime': int, 'df': DataFrame}}}}}
+
+The offsets are persisted as the interval_offsets dataset, next to the event store.
+"""
+
+from collections.abc import Mapping
+import pandas as pd
+from utils.event_store import run_starts
+
+SIDES = ['same', 'other']
+
+OFFSET_COLUMNS = ['pool', 'side', 'hashid', 'interval', 'start_row', 'end_row', 'blockTime']
+
+
+class HashIntervals(Mapping):
+    """
+    Intervals of one pool and side, keyed by hashid, each built on access.
+
+    Args:
+        store (EventStore): Events the offsets point into.
+        offsets (pd.DataFrame): Rows of the interval offsets for this pool and side, grouped by hashid.
+    """
+
+    def __init__(self, store, offsets):
+        self.store = store
+        self.interval = offsets['interval'].to_numpy()
+        self.start_row = offsets['start_row'].to_numpy()
+        self.end_row = offsets['end_row'].to_numpy()
+        self.block_time = offsets['blockTime'].to_numpy()
+        hashids = offsets['hashid'].to_numpy()
+        starts = run_starts(hashids).tolist()
+        self.bounds = dict(zip(hashids[starts].tolist(), zip(starts, starts[1:] + [len(hashids)])))
+
+    def __getitem__(self, hashid):
+        low, high = self.bounds[hashid]
+        intervals = {}
+        for row in range(low, high):
+            # An interval over several pools has one range per pool, concatenated in pool order
+            intervals.setdefault(int(self.interval[row]), []).append(row)
+        return {interval: {'blockTime': int(self.block_time[rows[0]]), 'df': self._frame(rows)}
+                for interval, rows in intervals.items()}
+
+    def _frame(self, rows):
+        if len(rows) == 1:
+            return self.store.frame(self.start_row[rows[0]], self.end_row[rows[0]])
+        return pd.concat([self.store.frame(self.start_row[row], self.end_row[row]) for row in rows])
+
+    def __iter__(self):
+        return iter(self.bounds)
+
+    def __len__(self):
+        return len(self.bounds)
+
+    def __contains__(self, hashid):
+        return hashid in self.bounds
+
+
+class IntervalOffsets(Mapping):
+    """
+    Interval dataframes of every pool, stored as row ranges into an event store.
+
+    Args:
+        store (EventStore): Events the offsets point into.
+        offsets (pd.DataFrame): One row per hashid, interval and event pool, with the OFFSET_COLUMNS, grouped by
+            pool, side and hashid.
+    """
+
+    def __init__(self, store, offsets):
+        self.store = store
+        self.offsets = offsets
+        self.pools = {}
+        for (pool, side), rows in offsets.groupby(['pool', 'side'], sort=False).indices.items():
+            self.pools.setdefault(pool, {key: {} for key in SIDES})[side] = HashIntervals(store, offsets.iloc[rows])
+
+    @classmethod
+    def load(cls, store, offsets):
+        """Rebuild the index from the event store it was created on and its stored offsets."""
+        return cls(store, offsets[OFFSET_COLUMNS])
+
+    def __getitem__(self, pool):
+        return self.pools[pool]
+
+    def __iter__(self):
+        return iter(self.pools)
+
+    def __len__(self):
+        return len(self.pools)
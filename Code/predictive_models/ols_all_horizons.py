@@ -1,9 +1,15 @@
+import os
+import sys
 import pandas as pd
 from utils.visualisations import plot_dataframes, dict_to_dataframe, advanced_plot_dataframes
 from utils.cols_management import cols_drop_correlated, cols_aggregate_intervals_range
 import utils.ols as ols
 import itertools
 
+sys.path.append(os.getcwd())
+
+from environment.storage import read_dataset
+
 """
 This script performs Ordinary Least Squares (OLS) regression analyses for predicting target variables related to cumulative volumes in different pools of a decentralized exchange.
 It does this under different feature sets: all features, a reduced set with multicollinearity minimized, and a set determined by stepwise selection.
@@ -49,14 +55,14 @@ for reference_pool, target_variables in run_args.items():
         print("Processing: {}-{}".format(reference_pool, target_variable))
 
         if 'all_features' in return_args[reference_pool]:
-            df_raw = pd.read_csv(f"Data/processed/features/df_features_raw_ref{reference_pool}.csv")
+            df_raw = read_dataset('features', pool=reference_pool)
             df, explainable_variables_filtered = ols.prepare_dataframe(df_raw, remove_list) # Exclusive for "all_features" model - A standard remove list due to multicollinearity and high number of nulls
             models, train_metrics, test_metrics = train_and_predict_for_all_horizons(df, target_variable, explainable_variables_filtered)
             return_args[reference_pool]['all_features']['train'][target_variable] = train_metrics
             return_args[reference_pool]['all_features']['test'][target_variable] = test_metrics
         if 'reduced_multicollinearity' in return_args[reference_pool]:
             # Further feature engineering
-            df_raw2 = pd.read_csv(f"Data/processed/features/df_features_raw_ref{reference_pool}.csv")
+            df_raw2 = read_dataset('features', pool=reference_pool)
             df2, _ = ols.prepare_dataframe(df_raw2, [])
             df2_engineered, explainable_variables_filtered_aggregated2 = ols.prepare_dataframe_engineered(df2, cols_drop_correlated, cols_aggregate_intervals_range)
             models, train_metrics, test_metrics = train_and_predict_for_all_horizons(df2_engineered, target_variable, explainable_variables_filtered_aggregated2)
@@ -64,7 +70,7 @@ for reference_pool, target_variables in run_args.items():
             return_args[reference_pool]['reduced_multicollinearity']['test'][target_variable] = test_metrics
         if 'step-wise' in return_args[reference_pool]:
             # Step-wise feature selection
-            df_raw3 = pd.read_csv(f"Data/processed/features/df_features_raw_ref{reference_pool}.csv")
+            df_raw3 = read_dataset('features', pool=reference_pool)
             df3, _ = ols.prepare_dataframe(df_raw3, [])
             df3_engineered, explainable_variables_filtered_aggregated3 = ols.prepare_dataframe_engineered(df3, cols_drop_correlated, cols_aggregate_intervals_range)
             selected_features3 = ols.stepwise_selection(df3_engineered, df3_engineered[target_variable], explainable_variables_filtered_aggregated3)
@@ -80,7 +86,7 @@ print("Reduced Multicollinearity: {}".format(len(explainable_variables_filtered_
 print("Step-wise: {}".format(len(selected_features3)))
 
 # Iterim, get rough count of train and tests datasets per pool
-base_df = pd.read_csv(f"Data/processed/features/df_features_raw_refbase.csv")
+base_df = read_dataset('features', pool='base')
 base_df = base_df[base_df['horizon_label'] <= 30]
 base_df['blocks'] = base_df['horizon_label'] * 10
 
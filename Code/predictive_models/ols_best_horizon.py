@@ -1,3 +1,5 @@
+import os
+import sys
 import pandas as pd
 import statsmodels.api as sm
 from statsmodels.stats.outliers_influence import variance_inflation_factor
@@ -10,6 +12,10 @@ from utils.clean_independent import replace_nulls, remove_nulls, aggregate_colum
 from utils.cols_management import explainable_variables, cols_drop_correlated, cols_aggregate_intervals_range, cols_replace_nulls
 import utils.ols as ols
 
+sys.path.append(os.getcwd())
+
+from environment.storage import read_dataset
+
 
 """
 This script conducts Ordinary Least Squares (OLS) regression analyses in three primary steps: initial analysis, individual run OLS, and all horizons run OLS.
@@ -66,7 +72,7 @@ def first_analysis():
     TARGET_VARIABLE = 'cum_volume_500'
 
     # Load data and filter based on the horizon label
-    df_all = pd.read_csv(f"Data/processed/features/df_features_raw_ref{REFERENCE_POOL}.csv")
+    df_all = read_dataset('features', pool=REFERENCE_POOL)
     df = df_all[df_all['horizon_label'] == HORIZON]
 
     # Replace nulls in the DataFrame
@@ -103,7 +109,7 @@ def individual_run_ols():
     target_variable = 'cum_volume_500'
 
     # Load data and filter based on the horizon label
-    df_all = pd.read_csv(f"Data/processed/features/df_features_raw_ref{REFERENCE_POOL}.csv")
+    df_all = read_dataset('features', pool=REFERENCE_POOL)
     df = df_all[df_all['horizon_label'] == HORIZON]
 
     # Replace nulls in the DataFrame
@@ -129,7 +135,7 @@ def all_horizons_run_ols():
     target_variable = 'cum_volume_500'
 
     # Load data and filter based on the horizon label
-    df_all = pd.read_csv(f"Data/processed/features/df_features_raw_ref{REFERENCE_POOL}.csv")
+    df_all = read_dataset('features', pool=REFERENCE_POOL)
     df = df_all[df_all['horizon_label'] <= 30]
 
     # Replace nulls in the DataFrame
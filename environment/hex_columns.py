@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+
+# Etherscan quantities returned as '0x' prefixed hex strings that fit in an int64
+HEX_INT_COLUMNS = ['blockNumber', 'gas', 'gasPrice', 'maxFeePerGas', 'maxPriorityFeePerGas', 'nonce',
+                   'transactionIndex', 'type', 'chainId', 'v']
+
+
+def decode_hex(values):
+    """
+    Decode '0x' prefixed hex strings to int64 in bulk.
+
+    The values are parsed straight into a preallocated int64 array with np.fromiter, without building an
+    intermediate object Series as .apply(lambda x: int(x, 16)) does.
+
+    Args:
+        values (array-like): Hex strings, with None or NaN for missing values. Already decoded integers pass through.
+
+    Returns:
+        np.ndarray or pd.arrays.IntegerArray: int64 values, masked where the input is missing.
+    """
+    series = pd.Series(values, dtype=None if len(values) else object)
+    if pd.api.types.is_numeric_dtype(series.dtype):
+        return series.to_numpy()
+    missing = series.isna().to_numpy()
+    text = series.where(~missing, '0x0').to_numpy()
+    decoded = np.fromiter((int(value, 16) for value in text), dtype=np.int64, count=len(text))
+    if missing.any():
+        return pd.arrays.IntegerArray(decoded, missing)
+    return decoded
+
+
+def decode_hex_columns(df, columns=HEX_INT_COLUMNS):
+    """Decode the hex columns of a DataFrame in place, skipping those it does not have."""
+    for column in columns:
+        if column in df.columns:
+            df[column] = decode_hex(df[column])
+    return df
@@ -0,0 +1,298 @@
+"""
+Storage Layer
+
+One read/write API for the datasets exchanged between the pipeline stages, so a stage names the dataset it
+needs instead of a file. With STORAGE_FORMAT = parquet (run-config.env) every dataset is a directory of Parquet
+files, hive partitioned by pool and/or day (e.g. Data/interim_results/df_reduced/pool=500/date=2022-06-19/),
+written with the explicit schema declared below. Readers get column projection and predicate pushdown: only the
+requested columns are decoded and partitions or row groups that cannot match the filters are skipped.
+With STORAGE_FORMAT = csv the datasets are the original CSV files, with projection and filters applied after
+parsing.
+
+The 'date' partition column is derived from the dataset's time column on write. It is not returned unless
+requested, but can be filtered on: filters=[('pool', '=', 500), ('date', '>=', '2022-06-20')].
+Rows come back in the order they were written.
+
+Usage:
+    write_dataset(df_reduced, 'df_reduced')
+    df = read_dataset('df_reduced', columns=['blockNumber', 'pool'], filters=[('pool', '=', 500)])
+    df = read_dataset('features', pool=500)
+"""
+
+import os
+import json
+import time
+import shutil
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+
+load_dotenv('environment/run-config.env')
+STORAGE_FORMAT = os.getenv("STORAGE_FORMAT", "csv").strip()
+
+UTC_TIMESTAMP = pa.timestamp('ns', tz='UTC')
+
+# Hidden column of partitioned datasets holding each row's position in the written frames
+ROW_ORDER = '__row'
+
+# Dataset name -> location, schema and layout:
+# - directory and file: where the dataset lives; file may hold {placeholders} filled from read/write keyword arguments
+# - schema: explicit arrow type of every column; columns missing from a frame are skipped
+# - default_type: type of undeclared columns (wide feature tables, block number chain links), None to infer them
+# - index: name given to the DataFrame index, which is stored as a column
+# - partition_by: partition columns, 'date' being the day of time_column
+datasets = {
+    'uniswap': {
+        'directory': 'Data/cleansed', 'file': 'uniswap',
+        'schema': {'id': pa.string(), 'timestamp': pa.int64(), 'amount0': pa.float64(), 'amount1': pa.float64(),
+                   'amountUSD': pa.float64(), 'pool': pa.int32(), 'transaction.id': pa.string(),
+                   'transaction.blockNumber': pa.int64(), 'transaction_type': pa.string(), 'amount': pa.float64(),
+                   'tickLower': pa.int32(), 'tickUpper': pa.int32()},
+        'partition_by': ['pool', 'date'], 'time_column': 'timestamp',
+    },
+    'etherscan': {
+        'directory': 'Data/cleansed', 'file': 'etherscan',
+        'schema': {'hash': pa.string(), 'blockHash': pa.string(), 'blockNumber': pa.int64(), 'from': pa.string(),
+                   'to': pa.string(), 'gas': pa.int64(), 'gasPrice': pa.int64(), 'maxFeePerGas': pa.int64(),
+                   'maxPriorityFeePerGas': pa.int64(), 'nonce': pa.int64(), 'transactionIndex': pa.int64(),
+                   'type': pa.int64(), 'chainId': pa.int64(), 'v': pa.int64(), 'value': pa.string(),
+                   'input': pa.string(), 'accessList': pa.string(), 'r': pa.string(), 's': pa.string()},
+    },
+    'binance': {
+        'directory': 'Data/cleansed', 'file': 'binance',
+        'schema': {'time': UTC_TIMESTAMP, 'CEX_traded_volume_BTC': pa.float64(), 'CEX_mid_price': pa.float64(),
+                   'CEX_transactions_count': pa.int64()},
+        'partition_by': ['date'], 'time_column': 'time',
+    },
+    'df_reduced': {
+        'directory': 'Data/interim_results', 'file': 'df_reduced',
+        'schema': {'timestamp': UTC_TIMESTAMP, 'transaction_type': pa.string(), 'pool': pa.int32(),
+                   'blockNumber': pa.int64(), 'size': pa.float64(), 'width': pa.float64(), 'pool_price': pa.float64(),
+                   'amountUSD': pa.float64()},
+        'partition_by': ['pool', 'date'], 'time_column': 'timestamp',
+    },
+    'df_blocks': {
+        'directory': 'Data/interim_results', 'file': 'df_blocks',
+        'schema': {'hashid': pa.int64(), 'pool': pa.int32(), 'timestamp': UTC_TIMESTAMP, 'blockNumber': pa.int64()},
+        'default_type': pa.int64(), 'partition_by': ['pool', 'date'], 'time_column': 'timestamp',
+    },
+    'df_blocks_full': {
+        'directory': 'Data/interim_results', 'file': 'df_blocks_full',
+        'schema': {'hashid': pa.int64(), 'pool': pa.int32(), 'timestamp': UTC_TIMESTAMP, 'blockNumber': pa.int64()},
+        'default_type': pa.int64(), 'partition_by': ['pool', 'date'], 'time_column': 'timestamp',
+    },
+    'hashid_translation': {
+        'directory': 'Data/interim_results', 'file': 'hashid_translation',
+        'schema': {'hashid': pa.int64(), 'crc32_hashid': pa.int64(), 'pool': pa.int32(), 'blockNumber': pa.int64()},
+    },
+    'interval_offsets': {
+        'directory': 'Data/interim_results', 'file': 'interval_offsets',
+        'schema': {'pool': pa.int32(), 'side': pa.string(), 'hashid': pa.int64(), 'interval': pa.int32(),
+                   'start_row': pa.int64(), 'end_row': pa.int64(), 'blockTime': pa.int64()},
+    },
+    'direct_pool': {
+        'directory': 'Data/processed', 'file': 'direct_pool',
+        'schema': {'hashid': pa.int64()}, 'default_type': pa.float64(), 'index': 'hashid',
+    },
+    'cex_spillovers': {
+        'directory': 'Data/processed', 'file': 'cex_spillovers',
+        'schema': {'hashid': pa.int64()}, 'default_type': pa.float64(), 'index': 'hashid',
+    },
+    'features': {
+        'directory': 'Data/processed/features', 'file': 'df_features_raw_ref{pool}',
+        'schema': {'blockNumber': pa.int64(), 'reference_blockNumber': pa.int64(), 'horizon_label': pa.int64(),
+                   'hashid': pa.int64(), 'pool': pa.int32()},
+    },
+}
+
+
+def dataset_path(name, storage_format=None, **name_args):
+    """Path of a dataset: a CSV file, or the root directory of its Parquet partitions."""
+    dataset = datasets[name]
+    path = os.path.join(dataset['directory'], dataset['file'].format(**name_args))
+    return path + '.csv' if (storage_format or STORAGE_FORMAT) == 'csv' else path
+
+
+def dataset_exists(name, storage_format=None, **name_args):
+    return os.path.exists(dataset_path(name, storage_format, **name_args))
+
+
+def partition_days(times):
+    """Day of each timestamp as 'YYYY-MM-DD', formatting each distinct day once. Integers are UNIX seconds."""
+    times = pd.Series(times)
+    if pd.api.types.is_numeric_dtype(times.dtype):
+        times = pd.to_datetime(times, unit='s', utc=True)
+    codes, days = pd.factorize(pd.to_datetime(times, utc=True).dt.floor('D'))
+    return np.asarray(days.strftime('%Y-%m-%d'), dtype=object)[codes]
+
+
+def arrow_schema(name, df):
+    """Arrow schema of a frame's columns, from the dataset's declared types."""
+    dataset = datasets[name]
+    fields = []
+    for column in df.columns:
+        arrow_type = dataset['schema'].get(column, dataset.get('default_type'))
+        if column == 'date' and 'date' in dataset.get('partition_by', []):
+            arrow_type = pa.string()
+        elif column == ROW_ORDER:
+            arrow_type = pa.int64()
+        if arrow_type is None:
+            arrow_type = pa.Schema.from_pandas(df[[column]], preserve_index=False).field(column).type
+        fields.append(pa.field(column, arrow_type))
+    return pa.schema(fields)
+
+
+def conform(df, schema):
+    """Convert the columns pandas cannot cast to their arrow type directly: categoricals, numbers held as text and
+    Python objects (e.g. lists) in string columns."""
+    df = df.copy(deep=False)
+    for field in schema:
+        series = df[field.name]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            series = series.astype(series.cat.categories.dtype)
+        if (pa.types.is_integer(field.type) or pa.types.is_floating(field.type)) and series.dtype == object:
+            series = pd.to_numeric(series)
+        elif pa.types.is_timestamp(field.type) and not pd.api.types.is_datetime64_any_dtype(series.dtype):
+            series = pd.to_datetime(series, utc=True)
+        elif pa.types.is_string(field.type) and series.dtype == object:
+            objects = series.notna() & ~series.map(lambda value: isinstance(value, str))
+            if objects.any():
+                series = series.where(~objects, series[objects].map(str))
+        df[field.name] = series
+    return df
+
+
+def write_dataset(df, name, append=False, storage_format=None, **name_args):
+    """
+    Write a DataFrame as a dataset.
+
+    Args:
+        df (pd.DataFrame): Data to write; the index is written only for datasets declaring one.
+        name (str): Dataset name, a key of datasets.
+        append (bool): Add the rows to the existing dataset instead of replacing it. With Parquet they are added
+            as new files and read after the existing rows.
+        storage_format (str): 'parquet' or 'csv', defaults to STORAGE_FORMAT.
+        name_args: Values for the placeholders of the dataset's file name.
+    """
+    dataset = datasets[name]
+    storage_format = storage_format or STORAGE_FORMAT
+    path = dataset_path(name, storage_format, **name_args)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    if storage_format == 'csv':
+        if dataset.get('index'):
+            df.to_csv(path, index_label=dataset['index'], mode='a' if append else 'w', header=not append)
+        else:
+            df.to_csv(path, index=False, mode='a' if append else 'w', header=not append)
+        return
+
+    if dataset.get('index'):
+        df = df.rename_axis(dataset['index']).reset_index()
+    partition_by = dataset.get('partition_by', [])
+    if 'date' in partition_by:
+        df = df.assign(date=partition_days(df[dataset['time_column']]))
+    if not append and os.path.exists(path):
+        shutil.rmtree(path)
+    os.makedirs(path, exist_ok=True)
+    if partition_by:
+        # The rows of a frame are spread over partitions, their ordinal restores the frame's order on read
+        start = ds.dataset(path, format='parquet').count_rows() if append else 0
+        df = df.assign(**{ROW_ORDER: np.arange(start, start + len(df), dtype=np.int64)})
+    schema = arrow_schema(name, df)
+    columns = [column for column in df.columns if column not in ('date', ROW_ORDER)]
+    schema = schema.with_metadata({'columns': json.dumps(columns)})
+    df = conform(df, schema)
+    table = pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+
+    # Files are named after the write time, so appended files sort after the existing ones
+    file_name = f'part-{time.time_ns()}.parquet'
+    if not partition_by:
+        pq.write_table(table, os.path.join(path, file_name))
+        return
+    table = table.drop(partition_by)
+    for key, rows in df.groupby(partition_by, sort=False).indices.items():
+        key = key if isinstance(key, tuple) else (key,)
+        directory = os.path.join(path, *[f'{column}={value}' for column, value in zip(partition_by, key)])
+        os.makedirs(directory, exist_ok=True)
+        pq.write_table(table.take(rows), os.path.join(directory, file_name))
+
+
+def apply_filters(df, filters):
+    """Apply filters given as (column, op, value) tuples, all of which must hold, to a DataFrame."""
+    operators = {'=': np.equal, '==': np.equal, '!=': np.not_equal, '<': np.less, '<=': np.less_equal,
+                 '>': np.greater, '>=': np.greater_equal}
+    mask = np.ones(len(df), dtype=bool)
+    for column, op, value in filters:
+        if op == 'in':
+            mask &= df[column].isin(value).values
+        elif op == 'not in':
+            mask &= ~df[column].isin(value).values
+        else:
+            mask &= operators[op](df[column], value).values
+    return df[mask]
+
+
+def read_dataset(name, columns=None, filters=None, nrows=None, storage_format=None, **name_args):
+    """
+    Read a dataset.
+
+    Args:
+        name (str): Dataset name, a key of datasets.
+        columns (list): Columns to read, all by default. The index of datasets declaring one is always read.
+        filters (list): (column, op, value) tuples that must all hold, op being one of =, ==, !=, <, <=, >, >=,
+            in and not in. With Parquet they are pushed down to the partitions and row groups.
+        nrows (int): Maximum number of rows to read.
+        storage_format (str): 'parquet' or 'csv', defaults to STORAGE_FORMAT.
+        name_args: Values for the placeholders of the dataset's file name.
+
+    Returns:
+        pd.DataFrame: The data, indexed by the dataset's index if it declares one.
+    """
+    dataset = datasets[name]
+    storage_format = storage_format or STORAGE_FORMAT
+    path = dataset_path(name, storage_format, **name_args)
+    index = dataset.get('index')
+    filters = filters or []
+    filter_columns = [column for column, _, _ in filters]
+
+    if storage_format == 'csv':
+        with_date = 'date' in filter_columns or (columns is not None and 'date' in columns)
+        read_columns = None
+        if columns is not None:
+            read_columns = columns + filter_columns + ([dataset['time_column']] if with_date else []) + ([index] if index else [])
+            read_columns = [column for column in dict.fromkeys(read_columns) if column != 'date']
+        # Filters are applied after parsing, so the row limit is applied after them
+        df = pd.read_csv(path, usecols=read_columns, index_col=index, nrows=None if filters else nrows)
+        if with_date:
+            df['date'] = partition_days(df[dataset['time_column']])
+        if filters:
+            df = apply_filters(df, filters)
+        if nrows is not None:
+            df = df.head(nrows)
+        if columns is not None:
+            return df[columns]
+        return df.drop(columns=['date']) if with_date else df
+
+    partition_by = dataset.get('partition_by', [])
+    partition_schema = pa.schema([pa.field(column, pa.string() if column == 'date' else dataset['schema'][column])
+                                  for column in partition_by])
+    source = ds.dataset(path, format='parquet',
+                        partitioning=ds.partitioning(partition_schema, flavor='hive') if partition_by else None)
+    stored_columns = json.loads(source.schema.metadata[b'columns']) if source.schema.metadata else source.schema.names
+    read_columns = list(columns) if columns is not None else stored_columns
+    if index and index not in read_columns:
+        read_columns = [index] + read_columns
+    expression = pq.filters_to_expression(filters) if filters else None
+    if ROW_ORDER in source.schema.names:
+        # Partitions come back one after the other, the row ordinal restores the order the rows were written in
+        table = source.to_table(columns=read_columns + [ROW_ORDER], filter=expression)
+        df = table.to_pandas().sort_values(ROW_ORDER, kind='stable').drop(columns=[ROW_ORDER]).reset_index(drop=True)
+        df = df.head(nrows) if nrows is not None else df
+    elif nrows is not None:
+        df = source.head(nrows, columns=read_columns, filter=expression).to_pandas()
+    else:
+        df = source.to_table(columns=read_columns, filter=expression).to_pandas()
+    return df.set_index(index) if index else df
@@ -0,0 +1,11 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The pipeline scripts import their sibling modules by name, as when run from their own folder
+for path in [ROOT,
+             os.path.join(ROOT, 'Code', 'data_sourcing_cleaning', 'uniswap'),
+             os.path.join(ROOT, 'Code', 'feature_engineering')]:
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,140 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.build_intervals import (CHAIN_SENTINEL, calculate_intervals, calculate_other_intervals, chain_matrix,
+                                   create_interval_dataframes)
+from utils.event_store import EventStore
+
+SHIFT_PERIODS = range(0, 4)
+
+
+def baseline_interval_dataframes(df_blocks, df, pool_col):
+    """
+    The dictionary create_interval_dataframes returned before the offsets index, with the chains as lists padded
+    with NaN, copying the events of every interval out of df.
+    """
+
+    def update_interval(chain_col, df_blocks, df):
+        dataframes = {}
+        for _, row in df_blocks.iterrows():
+            chain = row[chain_col]
+            max_index = max((i for i, x in enumerate(chain) if not np.isnan(x)), default=None)
+
+            reference_start = int(chain[0])
+            for i in range(max_index):
+                interval_start = int(chain[i])
+                interval_end = int(chain[i+1])
+                df_interval = df[(df['blockNumber'] <= interval_start) & (df['blockNumber'] > interval_end)].copy()
+                dataframes.setdefault(row['hashid'], {})[i] = {'blockTime': reference_start - interval_end, 'df': df_interval}
+            if max_index > 0:
+                # Last mint operation
+                interval_end = int(chain[i+1])
+                df_interval = df[df['blockNumber'] == interval_end].copy()
+                dataframes[row['hashid']][i+1] = {'blockTime': reference_start - interval_end, 'df': df_interval}
+        return dataframes
+
+    interval_dataframes = {}
+    for pool_same in df[pool_col].unique():
+        df_same = df[df[pool_col] == pool_same].copy(deep=True).reset_index(drop=True)
+        df_other = df[df[pool_col] != pool_same].copy(deep=True).reset_index(drop=True)
+        df_blocks_same = df_blocks[df_blocks[pool_col] == pool_same].copy(deep=True).reset_index(drop=True)
+        interval_dataframes[pool_same] = {
+            'same': update_interval('blockNumberChain', df_blocks_same, df_same),
+            'other': update_interval('other_blockNumberChain', df_blocks_same, df_other),
+        }
+    return interval_dataframes
+
+
+def chain_lists(df_blocks, chain_col):
+    """The chain columns of df_blocks as the former lists, NaN for the missing links."""
+    chains = chain_matrix(df_blocks, chain_col).astype(float)
+    chains[chains == CHAIN_SENTINEL] = np.nan
+    return [list(chain) for chain in chains]
+
+
+def make_events(pools, n_blocks, max_events_per_block, seed):
+    """
+    Events of every pool sorted by pool and blockNumber, as df_reduced is: several events per block, and at most
+    one mint per block as reduce_mints leaves them.
+    """
+    rng = np.random.default_rng(seed)
+    rows = []
+    for pool in pools:
+        for block in np.sort(rng.choice(np.arange(15000000, 15000000 + 4 * n_blocks), n_blocks, replace=False)):
+            n_events = rng.integers(1, max_events_per_block + 1)
+            types = rng.choice(['swaps', 'burns'], n_events).tolist()
+            if rng.random() < 0.4:
+                types[rng.integers(n_events)] = 'mints'
+            for transaction_type in types:
+                rows.append({'pool': pool, 'blockNumber': int(block), 'transaction_type': transaction_type,
+                             'timestamp': pd.Timestamp('2022-07-01') + pd.Timedelta(seconds=12 * int(block - 15000000)),
+                             'amountUSD': rng.random() * 1000})
+    return pd.DataFrame(rows)
+
+
+def build(df):
+    """Blocks with their chains, the offsets index and the baseline dictionary of the same events."""
+    df_blocks = calculate_other_intervals(calculate_intervals(df, 'pool', 'interval', SHIFT_PERIODS), 'pool')
+    offsets = create_interval_dataframes(df_blocks, EventStore.from_frame(df, 'pool'), 'pool')
+
+    df_blocks_lists = df_blocks[['hashid', 'pool']].copy()
+    df_blocks_lists['blockNumberChain'] = chain_lists(df_blocks, 'blockNumberChain')
+    df_blocks_lists['other_blockNumberChain'] = chain_lists(df_blocks, 'other_blockNumberChain')
+    baseline = baseline_interval_dataframes(df_blocks_lists, df, 'pool')
+    return df_blocks, offsets, baseline
+
+
+def assert_matches_baseline(offsets, baseline):
+    """Every IntervalOffsets[pool][side][hashid][interval] has the blockTime and the rows of the baseline."""
+    intervals = 0
+    for pool, sides in baseline.items():
+        for side, hashes in sides.items():
+            built = offsets[pool][side] if pool in offsets else {}
+            assert set(built) == set(hashes)
+            for hashid, expected in hashes.items():
+                actual = built[hashid]
+                assert list(actual) == list(expected)
+                for interval in expected:
+                    assert actual[interval]['blockTime'] == expected[interval]['blockTime']
+                    pd.testing.assert_frame_equal(actual[interval]['df'].reset_index(drop=True),
+                                                  expected[interval]['df'].reset_index(drop=True),
+                                                  check_dtype=False, check_index_type=False)
+                    intervals += 1
+    return intervals
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_three_pools(seed):
+    df = make_events([100, 500, 3000], n_blocks=60, max_events_per_block=3, seed=seed)
+    _, offsets, baseline = build(df)
+    assert assert_matches_baseline(offsets, baseline) > 0
+
+
+def test_single_pool():
+    df = make_events([500], n_blocks=80, max_events_per_block=3, seed=3)
+    _, offsets, baseline = build(df)
+    assert assert_matches_baseline(offsets, baseline) > 0
+    # Without another pool, the 'other' intervals hold no events
+    assert all(len(interval['df']) == 0 for intervals in offsets[500]['other'].values() for interval in intervals.values())
+
+
+def test_chains_with_one_block():
+    df = make_events([500, 3000], n_blocks=40, max_events_per_block=2, seed=4)
+    df_blocks, offsets, baseline = build(df)
+    assert_matches_baseline(offsets, baseline)
+
+    # The first mint of a pool has a single block in its chain, so no interval
+    first_mints = df_blocks.sort_values('blockNumber').groupby('pool')['hashid'].first()
+    for pool, hashid in first_mints.items():
+        assert hashid not in offsets[pool]['same'] and hashid not in baseline[pool]['same']
+
+
+def test_several_events_in_one_block():
+    df = make_events([500, 3000], n_blocks=40, max_events_per_block=4, seed=5)
+    _, offsets, baseline = build(df)
+    assert_matches_baseline(offsets, baseline)
+
+    frames = [interval['df'] for sides in offsets.values() for hashes in sides.values()
+              for intervals in hashes.values() for interval in intervals.values()]
+    assert any(frame['blockNumber'].duplicated().any() for frame in frames)
@@ -0,0 +1,110 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from uniswap_queries import iter_transaction_pages
+
+# (id, timestamp) of the swaps of the stand-in subgraph; '0xd' is indexed twice, as the subgraph can return a
+# transaction again across a page boundary
+SWAPS = [('0xa', 115), ('0xb', 112),
+         ('0xc1', 110), ('0xc2', 110), ('0xc3', 110), ('0xc4', 110), ('0xc5', 110),
+         ('0xd', 108), ('0xd', 108),
+         ('0xe1', 100), ('0xe2', 100),
+         ('0xf', 95),
+         ('0xg', 85), ('0xh', 120)]
+
+
+class SubgraphStandIn(BaseHTTPRequestHandler):
+    """
+    Answers the keyset queries of uniswap_queries over SWAPS: the range query orders by timestamp desc, with the
+    ties of one timestamp in reverse id order, and the ties query orders by id asc.
+    """
+    requests = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        variables = body['variables']
+        if 'before' in variables:
+            rows = [row for row in SWAPS if variables['start'] <= row[1] < variables['before']]
+            rows = sorted(rows, key=lambda row: (row[1], row[0]), reverse=True)
+        else:
+            rows = [row for row in SWAPS if row[1] == variables['timestamp'] and row[0] > variables['after']]
+            rows = sorted(rows)
+        rows = rows[:variables['first']]
+        self.requests.append((variables, len(rows)))
+
+        swaps = [{'id': tx_id, 'timestamp': str(timestamp)} for tx_id, timestamp in rows]
+        payload = json.dumps({'data': {'pools': [{'swaps': swaps}]}}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def subgraph():
+    SubgraphStandIn.requests = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), SubgraphStandIn)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}', SubgraphStandIn.requests
+    server.shutdown()
+    server.server_close()
+
+
+def ids(pages):
+    return [transaction['id'] for page in pages for transaction in page]
+
+
+def test_full_pages_ending_on_a_shared_timestamp(subgraph):
+    url, requests = subgraph
+    pages = list(iter_transaction_pages('swaps', 90, 120, 500, first=3, url=url))
+
+    # Every transaction of [start, end) once, in descending timestamp order
+    assert sorted(ids(pages)) == ['0xa', '0xb', '0xc1', '0xc2', '0xc3', '0xc4', '0xc5', '0xd', '0xe1', '0xe2', '0xf']
+    timestamps = [int(transaction['timestamp']) for page in pages for transaction in page]
+    assert timestamps == sorted(timestamps, reverse=True)
+
+    # The first page ends on 110: only the newer transactions are kept from it
+    assert ids(pages[:1]) == ['0xa', '0xb']
+
+
+def test_boundary_timestamp_is_drained_by_id(subgraph):
+    url, requests = subgraph
+    list(iter_transaction_pages('swaps', 90, 120, 500, first=3, url=url))
+
+    ties = [(variables['timestamp'], variables['after'], count) for variables, count in requests if 'after' in variables]
+    # 110 takes a full page then a short one, 100 a single short one
+    assert ties == [(110, '', 3), (110, '0xc3', 2), (100, '', 2)]
+    # The time cursor moves past each drained timestamp
+    assert [variables['before'] for variables, _ in requests if 'before' in variables] == [120, 110, 100]
+
+
+def test_repeated_transactions_are_yielded_once(subgraph):
+    url, requests = subgraph
+    pages = list(iter_transaction_pages('swaps', 90, 120, 500, first=3, url=url))
+
+    assert ids(pages).count('0xd') == 1
+    assert len(ids(pages)) == len(set(ids(pages)))
+
+
+def test_stops_on_a_short_page(subgraph):
+    url, requests = subgraph
+    pages = list(iter_transaction_pages('swaps', 90, 120, 500, first=3, url=url))
+
+    # The last request is the range query returning fewer than first transactions, nothing is requested after it
+    variables, count = requests[-1]
+    assert variables['before'] == 100 and count < 3
+    assert ids(pages[-1:]) == ['0xf']
+
+
+def test_empty_span(subgraph):
+    url, requests = subgraph
+    assert list(iter_transaction_pages('swaps', 121, 130, 500, first=3, url=url)) == []
+    assert len(requests) == 1